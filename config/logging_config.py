@@ -3,14 +3,140 @@
 统一配置应用程序日志系统
 """
 
+import atexit
+import io
 import logging
+import queue
 import sys
 import os
-from datetime import datetime
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 from typing import Optional
 
 
+# 日志文件写缓冲大小与定时落盘间隔
+LOG_BUFFER_SIZE = 64 * 1024
+LOG_FLUSH_INTERVAL = 30.0
+
+# 单条日志记录长度的保守估计（字节），用于轮转前的快速判断
+_MAX_RECORD_ESTIMATE = 4096
+
+
+class _FastRotatingFileHandler(RotatingFileHandler):
+    """
+    轮转文件处理器
+    - 64KB 写缓冲，普通记录不再逐条触发 write() 系统调用
+    - WARNING 及以上级别立即落盘，其余由定时器/轮转/关闭时落盘
+    - 文件大小远未达到 maxBytes 时跳过记录格式化和基类中的 exists/isfile 检查
+    """
+    
+    _flush_timer: Optional[threading.Timer] = None
+    
+    def _open(self):
+        raw = open(self.baseFilename, "ab", buffering=0)
+        return io.TextIOWrapper(
+            io.BufferedWriter(raw, buffer_size=LOG_BUFFER_SIZE),
+            encoding=self.encoding,
+            errors=self.errors,
+            write_through=True
+        )
+    
+    def shouldRollover(self, record) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        
+        # 快速路径：按单条记录上限估算，写入后仍低于阈值则无需格式化和 stat
+        # write_through 下文本层不留数据，buffer.tell() 即准确字节数且不会触发 flush
+        if self.maxBytes > 0:
+            if self.stream.buffer.tell() + _MAX_RECORD_ESTIMATE < self.maxBytes:
+                return False
+        
+        return super().shouldRollover(record)
+    
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            
+            self.stream.write(self.format(record) + self.terminator)
+            if record.levelno >= logging.WARNING:
+                self.stream.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+    
+    def start_flush_timer(self, interval: float = LOG_FLUSH_INTERVAL):
+        """启动后台定时落盘"""
+        self._flush_timer = threading.Timer(interval, self._on_flush_timer, args=(interval,))
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
+    
+    def _on_flush_timer(self, interval: float):
+        self.flush()
+        if self.stream is not None:
+            self.start_flush_timer(interval)
+    
+    def close(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        super().close()
+
+
+class _ConsoleHandler(logging.StreamHandler):
+    """
+    控制台处理器
+    - 记录一次性编码为字节后直接写入 stream.buffer，绕过文本层的逐次编码
+    - 输出到管道/文件时普通记录不逐条 flush，WARNING 及以上级别、关闭及退出时落盘；
+      输出到终端时逐条 flush（进度及时可见，且与 print 等文本层输出保持顺序）
+    - 无 buffer 属性的流（如被重定向的 StringIO）退回到文本写入
+    """
+    
+    def __init__(self, stream=None):
+        super().__init__(stream)
+        self._buffer = getattr(self.stream, "buffer", None)
+        self._encoding = getattr(self.stream, "encoding", None) or "utf-8"
+        try:
+            self._interactive = self.stream.isatty()
+        except (AttributeError, ValueError):
+            self._interactive = False
+    
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            if self._buffer is not None:
+                self._buffer.write(msg.encode(self._encoding, "replace"))
+            else:
+                self.stream.write(msg)
+            if self._interactive or record.levelno >= logging.WARNING:
+                self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+    
+    def flush(self):
+        self.acquire()
+        try:
+            if self._buffer is not None:
+                self._buffer.flush()
+            super().flush()
+        finally:
+            self.release()
+    
+    def close(self):
+        try:
+            self.flush()
+        except Exception:
+            pass
+        super().close()
+
+
 class LoggingConfig:
     """
     日志配置类
@@ -49,11 +175,18 @@ class LoggingConfig:
         self.backup_count = backup_count
         
         self.log_file: Optional[str] = None
+        
+        # 实际输出处理器由后台监听线程驱动，根日志器只挂 QueueHandler
+        self.handlers: list[logging.Handler] = []
+        self._listener: Optional[QueueListener] = None
     
     def setup(self) -> logging.Logger:
         """
         配置并返回根日志器
         
+        调用线程只把记录放入队列，格式化和文件/控制台写入由
+        QueueListener 后台线程完成，避免磁盘延迟阻塞处理流程
+        
         Returns:
             logging.Logger: 配置好的根日志器
         """
@@ -62,8 +195,10 @@ class LoggingConfig:
         root_logger.setLevel(self.log_level)
         
         # 清除现有处理器
+        self.shutdown()
         for handler in root_logger.handlers[:]:
             root_logger.removeHandler(handler)
+            handler.close()
         
         # 创建格式化器
         formatter = logging.Formatter(
@@ -73,29 +208,43 @@ class LoggingConfig:
         
         # 添加控制台处理器
         if self.log_to_console:
-            console_handler = logging.StreamHandler(sys.stdout)
-            console_handler.setLevel(self.log_level)
+            console_handler = _ConsoleHandler(sys.stdout)
             console_handler.setFormatter(formatter)
-            root_logger.addHandler(console_handler)
+            self.handlers.append(console_handler)
+            atexit.register(console_handler.flush)
         
         # 添加文件处理器
+        file_handler_error = None
         if self.log_to_file:
             log_path = self._ensure_log_dir()
             self.log_file = log_path
             
             try:
-                from logging.handlers import RotatingFileHandler
-                file_handler = RotatingFileHandler(
+                file_handler = _FastRotatingFileHandler(
                     log_path,
                     maxBytes=self.max_bytes,
                     backupCount=self.backup_count,
                     encoding='utf-8'
                 )
-                file_handler.setLevel(self.log_level)
                 file_handler.setFormatter(formatter)
-                root_logger.addHandler(file_handler)
+                file_handler.start_flush_timer()
+                atexit.register(file_handler.flush)
+                self.handlers.append(file_handler)
             except Exception as e:
-                root_logger.warning(f"Failed to create file handler: {e}")
+                file_handler_error = e
+        
+        # 队列转发：级别过滤在入队前完成，后台处理器不再单独设级别，
+        # 避免 set_log_level 调高级别时丢弃已入队的记录
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.setLevel(self.log_level)
+        root_logger.addHandler(queue_handler)
+        self._listener = QueueListener(log_queue, *self.handlers, respect_handler_level=True)
+        self._listener.start()
+        atexit.register(self.shutdown)
+        
+        if file_handler_error is not None:
+            root_logger.warning(f"Failed to create file handler: {file_handler_error}")
         
         # 配置第三方库日志级别
         logging.getLogger("PIL").setLevel(logging.WARNING)
@@ -103,13 +252,23 @@ class LoggingConfig:
         
         return root_logger
     
+    def shutdown(self):
+        """停止后台监听线程并关闭处理器（会先写完队列中的记录）"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+        
+        for handler in self.handlers:
+            handler.close()
+        self.handlers.clear()
+    
     def _ensure_log_dir(self) -> str:
         """确保日志目录存在"""
         log_dir = Path(self.log_dir)
         log_dir.mkdir(parents=True, exist_ok=True)
         
         # 生成日志文件名
-        timestamp = datetime.now().strftime("%Y%m%d")
+        timestamp = time.strftime("%Y%m%d")
         log_file = log_dir / f"video_upscaler_{timestamp}.log"
         
         return str(log_file)
@@ -147,7 +306,10 @@ def init_logging(
     Returns:
         logging.Logger: 根日志器
     """
-    global _config
+    global _config, _cached_logger
+    if _config is not None:
+        _config.shutdown()
+    _cached_logger = None
     _config = LoggingConfig(log_level=log_level, log_dir=log_dir, **kwargs)
     return _config.setup()
 
@@ -187,6 +349,9 @@ def set_log_level(level: int):
     Args:
         level: 日志级别 (logging.DEBUG/INFO/WARNING/ERROR/CRITICAL)
     """
+    global _cached_logger
+    _cached_logger = None
+    
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
     
@@ -195,34 +360,62 @@ def set_log_level(level: int):
 
 
 # 快捷方法
+# 消息参数请使用 % 占位符传入（如 info("frame %d", i)），由 logging 在级别过滤后再格式化
+# 缓存默认日志器，避免每次调用都经过 get_logger() 的查找
+_cached_logger: Optional[logging.Logger] = None
+
+
+def _get_cached_logger() -> logging.Logger:
+    """获取缓存的默认日志器"""
+    global _cached_logger
+    if _cached_logger is None:
+        _cached_logger = get_logger()
+    return _cached_logger
+
+
 def debug(msg: str, *args, **kwargs):
     """记录调试日志"""
-    get_logger().debug(msg, *args, **kwargs)
+    logger = _get_cached_logger()
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    logger.debug(msg, *args, **kwargs)
+
+
+def dbg(fmt: str, *args):
+    """
+    记录调试日志（热循环专用）
+    
+    使用 % 格式参数而非 f-string，未启用 DEBUG 时只做一次级别判断，
+    不会构造消息字符串，例如: dbg("frame %d done", i)
+    """
+    logger = _cached_logger or _get_cached_logger()
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(fmt, *args)
 
 
 def info(msg: str, *args, **kwargs):
     """记录信息日志"""
-    get_logger().info(msg, *args, **kwargs)
+    _get_cached_logger().info(msg, *args, **kwargs)
 
 
 def warning(msg: str, *args, **kwargs):
     """记录警告日志"""
-    get_logger().warning(msg, *args, **kwargs)
+    _get_cached_logger().warning(msg, *args, **kwargs)
 
 
 def error(msg: str, *args, **kwargs):
     """记录错误日志"""
-    get_logger().error(msg, *args, **kwargs)
+    _get_cached_logger().error(msg, *args, **kwargs)
 
 
 def critical(msg: str, *args, **kwargs):
     """记录严重错误日志"""
-    get_logger().critical(msg, *args, **kwargs)
+    _get_cached_logger().critical(msg, *args, **kwargs)
 
 
 def exception(msg: str, *args, **kwargs):
     """记录异常日志（带堆栈）"""
-    get_logger().exception(msg, *args, **kwargs)
+    _get_cached_logger().exception(msg, *args, **kwargs)
 
 
 if __name__ == "__main__":
@@ -3,7 +3,9 @@
 定义三档处理预设：流畅/标准/高清
 """
 
+import dataclasses
 from dataclasses import dataclass
+from types import MappingProxyType
 from typing import Optional
 from enum import Enum
 
@@ -15,7 +17,7 @@ class PresetLevel(Enum):
     HIGH = "high"        # 高清档
 
 
-@dataclass
+@dataclass(frozen=True)
 class PresetConfig:
     """
     预设配置数据类
@@ -27,11 +29,23 @@ class PresetConfig:
         target_fps: 目标帧率 (None表示保持原帧率)
         target_resolution: 目标分辨率 (如 "1920x1080", None表示自动计算)
         vram_required_gb: 显存需求(GB)
-        tile_size: 分块大小 (0表示不分块)
+        tile_size: 超分分块大小（超分引擎按此固定分块并构建 TensorRT 引擎；
+            0 表示不固定，由超分引擎按显存自动选择）
         use_interpolation: 是否启用补帧
         encoder_preset: 编码器预设 (fast/medium/slow)
         encoder_quality: 编码质量 (CRF值，越低质量越高)
+        precision: 超分推理精度 fp16/int8（int8 使用 TensorRT INT8 引擎，
+            首次运行按输入视频采样帧校准；画质有瑕疵时改回 fp16）
+    
+    预设为只读共享对象，需要修改参数时使用 replace() 生成副本
     """
+    # 手写 __slots__ 以兼容 Python 3.9（dataclass 的 slots 参数需要 3.10+）
+    __slots__ = (
+        "name", "description", "scale_factor", "target_fps", "target_resolution",
+        "vram_required_gb", "tile_size", "use_interpolation", "encoder_preset",
+        "encoder_quality", "precision"
+    )
+    
     name: str
     description: str
     scale_factor: int
@@ -42,6 +56,11 @@ class PresetConfig:
     use_interpolation: bool
     encoder_preset: str
     encoder_quality: int
+    precision: str
+    
+    def replace(self, **changes) -> "PresetConfig":
+        """返回修改了指定字段的新配置"""
+        return dataclasses.replace(self, **changes)
 
 
 # 预设配置定义
@@ -53,10 +72,11 @@ PRESETS = {
         target_fps=None,
         target_resolution="1920x1080",
         vram_required_gb=2.0,
-        tile_size=0,  # 小分辨率无需分块
+        tile_size=0,  # 由超分引擎按显存自动选择
         use_interpolation=False,
         encoder_preset="fast",
-        encoder_quality=23
+        encoder_quality=23,
+        precision="fp16"
     ),
     PresetLevel.STANDARD: PresetConfig(
         name="标准档",
@@ -68,7 +88,8 @@ PRESETS = {
         tile_size=400,  # 中等分块
         use_interpolation=True,
         encoder_preset="medium",
-        encoder_quality=20
+        encoder_quality=20,
+        precision="fp16"
     ),
     PresetLevel.HIGH: PresetConfig(
         name="高清档",
@@ -80,10 +101,36 @@ PRESETS = {
         tile_size=200,  # 小分块节省显存
         use_interpolation=True,
         encoder_preset="slow",
-        encoder_quality=18
+        encoder_quality=18,
+        precision="fp16"
     )
 }
 
+# 档位中文简称（GUI / 任务队列中使用）
+PRESET_LEVEL_NAMES = MappingProxyType({
+    PresetLevel.FAST: "流畅",
+    PresetLevel.STANDARD: "标准",
+    PresetLevel.HIGH: "高清"
+})
+
+# 名称到预设的只读映射（英文名与中文名）
+_NAME_TO_PRESET = MappingProxyType({
+    **{level.value: config for level, config in PRESETS.items()},
+    **{PRESET_LEVEL_NAMES[level]: config for level, config in PRESETS.items()}
+})
+
+# 处理倍速表 (相对于实时)，键为 (档位, 是否使用GPU)
+_BASE_SPEED = {
+    PresetLevel.FAST: 2.0,      # 2倍实时
+    PresetLevel.STANDARD: 0.5,   # 0.5倍实时
+    PresetLevel.HIGH: 0.25      # 0.25倍实时
+}
+_SPEED_TABLE = {
+    (level, has_gpu): speed * (1.0 if has_gpu else 0.1)  # CPU处理更慢
+    for level, speed in _BASE_SPEED.items()
+    for has_gpu in (True, False)
+}
+
 
 def get_preset_config(preset_level: PresetLevel) -> PresetConfig:
     """
@@ -108,16 +155,7 @@ def get_preset_by_name(name: str) -> Optional[PresetConfig]:
     Returns:
         PresetConfig or None: 预设配置对象
     """
-    name_map = {
-        "fast": PresetLevel.FAST,
-        "standard": PresetLevel.STANDARD,
-        "high": PresetLevel.HIGH,
-        "流畅": PresetLevel.FAST,
-        "标准": PresetLevel.STANDARD,
-        "高清": PresetLevel.HIGH
-    }
-    level = name_map.get(name.lower())
-    return PRESETS.get(level) if level else None
+    return _NAME_TO_PRESET.get(name.lower())
 
 
 def list_presets() -> list[dict]:
@@ -156,21 +194,9 @@ def estimate_processing_time(
     Returns:
         float: 估算处理时间(秒)
     """
-    config = get_preset_config(preset_level)
-    
-    # 基础倍速 (相对于实时)
-    speed_multipliers = {
-        PresetLevel.FAST: 2.0,      # 2倍实时
-        PresetLevel.STANDARD: 0.5,   # 0.5倍实时
-        PresetLevel.HIGH: 0.25      # 0.25倍实时
-    }
-    
-    speed = speed_multipliers.get(preset_level, 0.5)
-    
-    # CPU处理更慢
-    if not has_gpu:
-        speed *= 0.1
-    
+    speed = _SPEED_TABLE.get((preset_level, has_gpu))
+    if speed is None:
+        speed = 0.5 if has_gpu else 0.05
     return video_duration / speed
 
 
@@ -2,8 +2,60 @@
 全局配置
 """
 import os
+import tempfile
+from functools import cache, lru_cache
 from pathlib import Path
 
+from config.presets import PRESETS, PRESET_LEVEL_NAMES
+
+
+_HERE = Path(__file__).resolve()
+_PROJECT_ROOT = _HERE.parent.parent
+_MODELS_DIR = _PROJECT_ROOT / "models"
+
+
+# 以下路径在一次运行中不会变化，首次调用时解析并创建目录，之后直接返回缓存结果
+
+@cache
+def _models_dir() -> Path:
+    """解析模型目录"""
+    # 项目目录优先
+    if _MODELS_DIR.exists():
+        return _MODELS_DIR
+    
+    # 用户目录
+    home = Path.home()
+    user_dir = home / ".video-upscaler" / "models"
+    user_dir.mkdir(parents=True, exist_ok=True)
+    return user_dir
+
+
+@cache
+def _temp_dir() -> Path:
+    """解析临时目录"""
+    temp = Path(tempfile.gettempdir()) / "video-upscaler"
+    temp.mkdir(exist_ok=True)
+    return temp
+
+
+@lru_cache(maxsize=256)
+def _output_path(input_path: str, preset: str) -> str:
+    """根据输入路径和预设生成输出路径"""
+    path = Path(input_path)
+    suffix = path.suffix
+    stem = path.stem
+    
+    # 后缀标记
+    suffix_map = {
+        "流畅": "_720p",
+        "标准": "_1080p60",
+        "高清": "_4K"
+    }
+    marker = suffix_map.get(preset, "_upscaled")
+    
+    output_name = f"{stem}{marker}{suffix}"
+    return str(path.parent / output_name)
+
 
 class Settings:
     """应用配置"""
@@ -16,12 +68,18 @@ class Settings:
     DEFAULT_CODEC = "h264_nvenc"  # hevc_nvenc, libx264
     DEFAULT_CRF = 18  # 18-23 is good quality
     
-    # 显存限制 (MB)
+    # 显存限制 (MB)，由 config.presets 中的预设派生
     VRAM_LIMITS = {
-        "流畅": 2048,   # 2GB
-        "标准": 4096,   # 4GB
-        "高清": 6144,   # 6GB (4050极限)
+        PRESET_LEVEL_NAMES[level]: int(config.vram_required_gb * 1024)
+        for level, config in PRESETS.items()
+    }
+    
+    # 支持的文件格式（frozenset，扩展名判断为 O(1) 查找）
+    SUPPORTED_FORMATS = {
+        "video": frozenset({".mp4", ".mkv", ".avi", ".mov", ".wmv", ".flv", ".webm"}),
+        "image": frozenset({".png", ".jpg", ".jpeg", ".bmp", ".tiff"}),
     }
+    ALL_SUPPORTED = SUPPORTED_FORMATS["video"] | SUPPORTED_FORMATS["image"]
     
     # 最大同时处理数 (RTX 4050 建议单任务)
     MAX_WORKERS = 1
@@ -32,41 +90,14 @@ class Settings:
     @classmethod
     def get_models_dir(cls) -> Path:
         """获取模型目录"""
-        # 项目目录优先
-        project_models = Path(__file__).parent.parent / "models"
-        if project_models.exists():
-            return project_models
-        
-        # 用户目录
-        home = Path.home()
-        user_dir = home / ".video-upscaler" / "models"
-        user_dir.mkdir(parents=True, exist_ok=True)
-        return user_dir
+        return _models_dir()
     
     @classmethod
     def get_temp_dir(cls) -> Path:
         """获取临时目录"""
-        import tempfile
-        temp = Path(tempfile.gettempdir()) / "video-upscaler"
-        temp.mkdir(exist_ok=True)
-        return temp
+        return _temp_dir()
     
     @classmethod
     def get_output_path(cls, input_path: str, preset: str) -> str:
         """生成输出路径"""
-        from pathlib import Path
-        
-        path = Path(input_path)
-        suffix = path.suffix
-        stem = path.stem
-        
-        # 后缀标记
-        suffix_map = {
-            "流畅": "_720p",
-            "标准": "_1080p60",
-            "高清": "_4K"
-        }
-        marker = suffix_map.get(preset, "_upscaled")
-        
-        output_name = f"{stem}{marker}{suffix}"
-        return str(path.parent / output_name)
+        return _output_path(input_path, preset)
@@ -0,0 +1,123 @@
+"""
+缓冲日志输出
+将日志记录攒到内存缓冲区中批量写入 stderr，避免逐帧进度日志逐条触发 write() 系统调用
+"""
+
+import atexit
+import logging
+import sys
+import threading
+from typing import Optional
+
+# 默认缓冲大小与定时落盘间隔（秒）
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 0.1
+
+
+class BufferedLogHandler(logging.Handler):
+    """
+    缓冲日志处理器
+    - 记录编码后攒到内存缓冲区，超过 buffer_size 时才写出
+    - 后台定时器按 flush_interval 落盘，WARNING 及以上级别立即落盘
+    """
+
+    def __init__(
+        self,
+        stream=None,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        buffer_size: int = DEFAULT_BUFFER_SIZE
+    ):
+        super().__init__()
+        stream = stream if stream is not None else sys.stderr
+        self._raw = getattr(stream, "buffer", None)
+        if self._raw is None:
+            raise ValueError("stream 必须提供二进制 buffer 属性")
+
+        # 先清空文本层中已有的输出，保证顺序
+        stream.flush()
+        self._encoding = getattr(stream, "encoding", None) or "utf-8"
+        self._pending = bytearray()
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._timer: Optional[threading.Timer] = None
+        self._closed = False
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._closed or self.flush_interval <= 0:
+            return
+        self._timer = threading.Timer(self.flush_interval, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        self.flush()
+        self._schedule_flush()
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + "\n"
+            self._pending += msg.encode(self._encoding, "replace")
+            if record.levelno >= logging.WARNING or len(self._pending) >= self.buffer_size:
+                self._write_pending()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _write_pending(self):
+        if not self._pending:
+            return
+        try:
+            self._raw.write(self._pending)
+            self._raw.flush()
+        except ValueError:
+            # 底层流已关闭（解释器退出阶段）
+            pass
+        self._pending.clear()
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._write_pending()
+        finally:
+            self.release()
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._closed = True
+        self.flush()
+        super().close()
+
+
+def install_buffered_stderr_handler(
+    flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    buf: int = DEFAULT_BUFFER_SIZE,
+    level: int = logging.INFO,
+    fmt: str = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+) -> BufferedLogHandler:
+    """
+    在根日志器上安装缓冲 stderr 处理器
+
+    适用于未经过 config.logging_config 初始化的独立脚本（如模块自测）
+
+    Args:
+        flush_interval: 定时落盘间隔（秒）
+        buf: 缓冲区大小（字节）
+        level: 根日志器级别
+        fmt: 日志格式
+
+    Returns:
+        BufferedLogHandler: 已安装的处理器
+    """
+    handler = BufferedLogHandler(sys.stderr, flush_interval=flush_interval, buffer_size=buf)
+    handler.setFormatter(logging.Formatter(fmt))
+
+    root_logger = logging.getLogger()
+    root_logger.addHandler(handler)
+    root_logger.setLevel(level)
+
+    atexit.register(handler.flush)
+    return handler
@@ -2,14 +2,220 @@
 环境检测模块
 检查 FFmpeg、CUDA、模型等依赖
 """
+import importlib.util
 import os
 import sys
+import shlex
 import subprocess
-import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from functools import lru_cache
 from typing import Tuple, List, Optional
 
 
+_HERE = Path(__file__).resolve()
+_PROJECT_ROOT = _HERE.parent.parent
+_MODELS_DIR = _PROJECT_ROOT / "models"
+
+# 探测结果在一次运行中不会变化，缓存在模块级，
+# GUI / 工作线程 / CLI 重复检测时直接复用；需要重新探测时调用 EnvironmentChecker.refresh()
+
+# FFmpeg 常见安装位置（PATH 之外）
+_FFMPEG_COMMON_PATHS = [
+    "/usr/bin",
+    "/usr/local/bin",
+    "/opt/ffmpeg/bin",
+    os.path.expanduser("~/.local/bin"),
+]
+
+_EXE_SUFFIX = ".exe" if sys.platform == "win32" else ""
+
+
+@lru_cache(maxsize=1)
+def _probe_ffmpeg() -> Tuple[Optional[str], Optional[str]]:
+    """查找 FFmpeg / FFprobe，返回 (ffmpeg_path, ffprobe_path)
+
+    按 PATH + 常见安装位置的顺序逐个目录 scandir 一次，
+    在内存中判断两个可执行文件是否都在，避免逐个 stat
+    """
+    ffmpeg_name = "ffmpeg" + _EXE_SUFFIX
+    ffprobe_name = "ffprobe" + _EXE_SUFFIX
+
+    path_dirs = os.environ.get("PATH", "").split(os.pathsep)
+    search_dirs = list(dict.fromkeys(d for d in path_dirs + _FFMPEG_COMMON_PATHS if d))
+
+    for directory in search_dirs:
+        try:
+            with os.scandir(directory) as it:
+                entries = {entry.name for entry in it}
+        except OSError:
+            continue
+
+        if ffmpeg_name not in entries or ffprobe_name not in entries:
+            continue
+
+        ffmpeg_path = os.path.join(directory, ffmpeg_name)
+        ffprobe_path = os.path.join(directory, ffprobe_name)
+
+        # 验证版本
+        try:
+            result = subprocess.run(
+                [ffmpeg_path, "-version"],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+            if result.returncode == 0:
+                return ffmpeg_path, ffprobe_path
+        except Exception:
+            pass
+
+    return None, None
+
+
+_PROBE_SENTINEL = "==VIDEO_UPSCALER_PROBE=="
+
+
+def _probe_all_versions(commands: dict) -> dict:
+    """
+    在单个 shell 进程中依次运行多个探测命令
+
+    每条命令后输出 "<哨兵><名称> <返回码>"，再按哨兵切分标准输出，
+    将多次进程启动合并为一次（Windows 上进程创建开销尤其明显）
+
+    Args:
+        commands: {名称: 参数列表}
+
+    Returns:
+        dict: {名称: (返回码, 标准输出)}，shell 本身失败时返回空字典
+    """
+    if sys.platform == "win32":
+        # 延迟变量扩展，保证 !errorlevel! 取到的是前一条命令的返回码
+        parts = [
+            f"{subprocess.list2cmdline(argv)} 2>nul & echo {_PROBE_SENTINEL}{name} !errorlevel!"
+            for name, argv in commands.items()
+        ]
+        shell_cmd = ["cmd", "/v:on", "/c", " & ".join(parts)]
+    else:
+        parts = [
+            f'{shlex.join(argv)} 2>/dev/null; echo "{_PROBE_SENTINEL}{name} $?"'
+            for name, argv in commands.items()
+        ]
+        shell_cmd = ["sh", "-c", "; ".join(parts)]
+
+    try:
+        result = subprocess.run(
+            shell_cmd,
+            capture_output=True,
+            text=True,
+            timeout=5 * len(commands)
+        )
+    except Exception:
+        return {}
+
+    sections = {}
+    lines = []
+    for line in result.stdout.splitlines():
+        if line.startswith(_PROBE_SENTINEL):
+            name, _, code = line[len(_PROBE_SENTINEL):].rpartition(" ")
+            try:
+                sections[name] = (int(code), "\n".join(lines))
+            except ValueError:
+                sections[name] = (-1, "\n".join(lines))
+            lines = []
+        else:
+            lines.append(line)
+
+    return sections
+
+
+@lru_cache(maxsize=1)
+def _probe_cuda() -> Tuple[bool, Optional[str]]:
+    """检测 CUDA，返回 (是否可用, CUDA 版本)"""
+    # 优先通过 torch 检查：处理流程本身就依赖 torch，且无需启动子进程
+    # （torch.cuda.is_available 会初始化 CUDA 运行时，借助缓存只做一次）
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return True, torch.version.cuda
+    except ImportError:
+        pass
+
+    # 未安装 torch 或 torch 不支持 CUDA（如 CPU 版 wheel，显卡驱动仍可用）时
+    # 回退到 nvidia-smi / nvcc（合并为一次 shell 调用）
+    results = _probe_all_versions({
+        "nvsmi": ["nvidia-smi", "--query-gpu=name,driver_version,memory.total", "--format=csv,noheader"],
+        "nvcc": ["nvcc", "--version"],
+    })
+
+    smi_code, _ = results.get("nvsmi", (-1, ""))
+    if smi_code == 0:
+        cuda_version = None
+        # 获取 CUDA 版本
+        nvcc_code, nvcc_output = results.get("nvcc", (-1, ""))
+        if nvcc_code == 0:
+            for line in nvcc_output.split('\n'):
+                if "release" in line:
+                    cuda_version = line.split("release")[-1].split(",")[0].strip()
+        return True, cuda_version
+
+    return False, None
+
+
+@lru_cache(maxsize=1)
+def _probe_pytorch() -> bool:
+    """检测 PyTorch / torchvision 是否已安装（只查找模块，不执行 import）"""
+    try:
+        return (
+            importlib.util.find_spec("torch") is not None
+            and importlib.util.find_spec("torchvision") is not None
+        )
+    except (ImportError, ValueError):
+        return False
+
+
+@lru_cache(maxsize=1)
+def _probe_torch_info() -> Optional[Tuple[str, Optional[str]]]:
+    """导入 torch 获取详细信息，返回 (版本, GPU 名称)，未安装时返回 None"""
+    try:
+        import torch
+    except ImportError:
+        return None
+
+    gpu_name = None
+    if torch.cuda.is_available():
+        gpu_name = torch.cuda.get_device_name(0)
+    return torch.__version__, gpu_name
+
+
+@lru_cache(maxsize=1)
+def _probe_models() -> Tuple[Tuple[str, bool], ...]:
+    """检测模型文件，返回 ((模型名, 是否存在), ...)"""
+    user_models = Path.home() / ".video-upscaler" / "models"
+
+    required_models = {
+        "RealESRGAN_x4plus.pth": [_MODELS_DIR, user_models],
+        "RealESRGAN_x2plus.pth": [_MODELS_DIR, user_models],
+    }
+
+    # 每个目录只读取一次，再在内存中判断模型是否存在
+    present = {}
+    for search_dir in {path for paths in required_models.values() for path in paths}:
+        try:
+            with os.scandir(search_dir) as it:
+                present[search_dir] = {entry.name for entry in it}
+        except OSError:
+            present[search_dir] = set()
+
+    status = []
+    for model_name, search_paths in required_models.items():
+        found = any(model_name in present[path] for path in search_paths)
+        status.append((model_name, found))
+
+    return tuple(status)
+
+
 class EnvironmentChecker:
     """环境检测器"""
 
@@ -20,57 +226,49 @@ class EnvironmentChecker:
         self.cuda_version = None
         self.python_version = sys.version_info
         self.missing_deps = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def refresh():
+        """清除探测缓存，下次检查时重新探测（如安装依赖/下载模型后）"""
+        _probe_ffmpeg.cache_clear()
+        _probe_cuda.cache_clear()
+        _probe_pytorch.cache_clear()
+        _probe_torch_info.cache_clear()
+        _probe_models.cache_clear()
 
     def check_all(self) -> dict:
-        """运行所有检查"""
-        return {
-            "ffmpeg": self.check_ffmpeg(),
-            "cuda": self.check_cuda(),
-            "python": self.check_python(),
-            "models": self.check_models(),
-            "pytorch": self.check_pytorch(),
+        """运行所有检查
+
+        各项检查主要耗时在子进程和 import 上，互不依赖，并行执行
+        """
+        checks = {
+            "ffmpeg": self.check_ffmpeg,
+            "cuda": self.check_cuda,
+            "python": self.check_python,
+            "models": self.check_models,
+            "pytorch": self.check_pytorch,
         }
 
+        with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+            futures = {name: executor.submit(check) for name, check in checks.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    def _add_missing_dep(self, dep: dict):
+        """记录缺失依赖（线程安全）"""
+        with self._lock:
+            self.missing_deps.append(dep)
+
     def check_ffmpeg(self) -> bool:
         """检查 FFmpeg 是否可用"""
-        # 先检查系统 PATH
-        ffmpeg_path = shutil.which("ffmpeg")
-        ffprobe_path = shutil.which("ffprobe")
-
+        ffmpeg_path, ffprobe_path = _probe_ffmpeg()
         if ffmpeg_path and ffprobe_path:
-            # 验证版本
-            try:
-                result = subprocess.run(
-                    [ffmpeg_path, "-version"],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                if result.returncode == 0:
-                    version_line = result.stdout.split('\n')[0]
-                    self.ffmpeg_path = ffmpeg_path
-                    self.ffprobe_path = ffprobe_path
-                    return True
-            except Exception:
-                pass
-
-        # 检查常见安装位置
-        common_paths = [
-            "/usr/bin",
-            "/usr/local/bin",
-            "/opt/ffmpeg/bin",
-            os.path.expanduser("~/.local/bin"),
-        ]
-
-        for path in common_paths:
-            ffmpeg = os.path.join(path, "ffmpeg")
-            ffprobe = os.path.join(path, "ffprobe")
-            if os.path.exists(ffmpeg) and os.path.exists(ffprobe):
-                self.ffmpeg_path = ffmpeg
-                self.ffprobe_path = ffprobe
-                return True
+            with self._lock:
+                self.ffmpeg_path = ffmpeg_path
+                self.ffprobe_path = ffprobe_path
+            return True
 
-        self.missing_deps.append({
+        self._add_missing_dep({
             "name": "FFmpeg",
             "install_guide": self._get_ffmpeg_install_guide()
         })
@@ -78,44 +276,13 @@ class EnvironmentChecker:
 
     def check_cuda(self) -> bool:
         """检查 CUDA 是否可用"""
-        try:
-            # 检查 nvidia-smi
-            result = subprocess.run(
-                ["nvidia-smi", "--query-gpu=name,driver_version,memory.total", "--format=csv,noheader"],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if result.returncode == 0:
-                self.cuda_available = True
-                # 获取 CUDA 版本
-                version_result = subprocess.run(
-                    ["nvcc", "--version"],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                if version_result.returncode == 0:
-                    for line in version_result.stdout.split('\n'):
-                        if "release" in line:
-                            self.cuda_version = line.split("release")[-1].split(",")[0].strip()
-                return True
-        except FileNotFoundError:
-            pass
-        except Exception:
-            pass
-
-        # 也通过 torch 检查
-        try:
-            import torch
-            if torch.cuda.is_available():
-                self.cuda_available = True
-                self.cuda_version = torch.version.cuda
-                return True
-        except ImportError:
-            pass
+        available, version = _probe_cuda()
+        if available:
+            self.cuda_available = True
+            self.cuda_version = version
+            return True
 
-        self.missing_deps.append({
+        self._add_missing_dep({
             "name": "CUDA",
             "optional": True,
             "install_guide": "CUDA 可选，没有会回退到 CPU 处理（较慢）"
@@ -128,37 +295,30 @@ class EnvironmentChecker:
 
     def check_models(self) -> dict:
         """检查模型文件是否存在"""
-        models_dir = Path(__file__).parent.parent / "models"
-        user_models = Path.home() / ".video-upscaler" / "models"
-
-        required_models = {
-            "RealESRGAN_x4plus.pth": [models_dir, user_models],
-            "RealESRGAN_x2plus.pth": [models_dir, user_models],
-        }
-
-        status = {}
-        for model_name, search_paths in required_models.items():
-            found = False
-            for path in search_paths:
-                if (path / model_name).exists():
-                    found = True
-                    break
-            status[model_name] = found
-
-        return status
+        return dict(_probe_models())
 
     def check_pytorch(self) -> bool:
         """检查 PyTorch 是否安装"""
-        try:
-            import torch
-            import torchvision
+        if _probe_pytorch():
             return True
-        except ImportError:
-            self.missing_deps.append({
-                "name": "PyTorch",
-                "install_guide": "pip install torch torchvision --index-url https://download.pytorch.org/whl/cu121"
-            })
-            return False
+
+        self._add_missing_dep({
+            "name": "PyTorch",
+            "install_guide": "pip install torch torchvision --index-url https://download.pytorch.org/whl/cu121"
+        })
+        return False
+
+    def get_torch_info(self) -> Optional[dict]:
+        """获取 PyTorch 版本与 GPU 信息
+
+        会真正导入 torch（耗时数秒），仅在需要详细信息时调用；
+        只判断是否安装请使用 check_pytorch
+        """
+        info = _probe_torch_info()
+        if info is None:
+            return None
+        version, gpu_name = info
+        return {"version": version, "gpu_name": gpu_name}
 
     def get_ffmpeg_path(self) -> Tuple[Optional[str], Optional[str]]:
         """获取 FFmpeg 路径"""
@@ -191,12 +351,12 @@ class EnvironmentChecker:
             lines.append("⚠ CUDA: 未检测到（将使用 CPU）")
 
         # PyTorch
-        try:
-            import torch
-            lines.append(f"✓ PyTorch: {torch.__version__}")
-            if torch.cuda.is_available():
-                lines.append(f"  GPU: {torch.cuda.get_device_name(0)}")
-        except ImportError:
+        torch_info = self.get_torch_info()
+        if torch_info is not None:
+            lines.append(f"✓ PyTorch: {torch_info['version']}")
+            if torch_info["gpu_name"]:
+                lines.append(f"  GPU: {torch_info['gpu_name']}")
+        else:
             lines.append("✗ PyTorch: 未安装")
 
         # Python
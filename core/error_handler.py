@@ -2,16 +2,35 @@
 错误处理和健壮性改进
 统一的错误处理和恢复机制
 """
+import gc
 import os
+import stat
 import sys
+import time
 import traceback
 import logging
-from functools import wraps
+from functools import lru_cache, wraps
+from types import MappingProxyType
 from typing import Optional, Callable, Any
 from pathlib import Path
 
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+from config.settings import Settings
+
 logger = logging.getLogger(__name__)
 
+# 支持的视频扩展名（与 Settings.SUPPORTED_FORMATS 保持一致）
+_SUPPORTED_VIDEO_EXTS = Settings.SUPPORTED_FORMATS["video"]
+
 
 class VideoUpscalerError(Exception):
     """基础错误类"""
@@ -102,6 +121,12 @@ def handle_errors(
         log_level: 日志级别
     """
     def decorator(func: Callable) -> Callable:
+        # 日志函数、级别与错误描述在装饰时解析一次
+        log_func = getattr(logger, log_level, logger.error)
+        level_num = logging._nameToLevel.get(log_level.upper(), logging.ERROR)
+        error_desc = ERROR_CODES.get(error_code, "未知错误")
+        log_prefix = f"{error_desc} [{error_code}]"
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
             try:
@@ -109,21 +134,17 @@ def handle_errors(
             except VideoUpscalerError:
                 raise
             except Exception as e:
-                # 获取错误描述
-                error_desc = ERROR_CODES.get(error_code, "未知错误")
-                
-                # 构建错误详情
-                details = {
-                    "function": func.__name__,
-                    "exception": str(e),
-                    "traceback": traceback.format_exc()
-                }
-                
-                # 记录日志
-                log_func = getattr(logger, log_level, logger.error)
-                log_func(f"{error_desc} [{error_code}]: {e}")
+                # 记录日志（级别未启用时不格式化消息；traceback 交由处理器按需格式化）
+                if logger.isEnabledFor(level_num):
+                    log_func("%s: %s", log_prefix, e, exc_info=True)
                 
                 if reraise:
+                    # 构建错误详情（仅在需要抛出时生成 traceback）
+                    details = {
+                        "function": func.__name__,
+                        "exception": str(e),
+                        "traceback": traceback.format_exc()
+                    }
                     raise VideoUpscalerError(
                         error_desc,
                         error_code=error_code,
@@ -165,6 +186,7 @@ class ErrorRecovery:
     
     def __init__(self):
         self.recovery_strategies = {}
+        self._strategies = MappingProxyType({})
         self.max_retries = 3
         self.retry_delay = 1.0  # 秒
     
@@ -176,27 +198,77 @@ class ErrorRecovery:
             strategy: 恢复函数
         """
         self.recovery_strategies[error_code] = strategy
+        # 只读快照，attempt_recovery 只读取快照
+        self._strategies = MappingProxyType(dict(self.recovery_strategies))
     
-    def attempt_recovery(self, error: VideoUpscalerError, context: dict = None) -> bool:
-        """尝试恢复
+    def attempt_recovery(
+        self,
+        error: VideoUpscalerError,
+        context: dict = None,
+        max_retries: Optional[int] = None
+    ) -> bool:
+        """尝试恢复（失败时按指数退避重试）
+        
+        退避等待在调用线程中 time.sleep，最多阻塞 retry_delay * (2**(n-1) - 1) 秒
+        （n 为尝试次数）；不要在 GUI 线程中调用
         
         Args:
             error: 错误对象
             context: 上下文信息
+            max_retries: 最大尝试次数，默认使用 self.max_retries；
+                至少尝试一次，0 或 1 表示不重试
         
         Returns:
             是否恢复成功
         """
-        strategy = self.recovery_strategies.get(error.error_code)
-        if strategy:
+        strategy = self._strategies.get(error.error_code)
+        if strategy is None:
+            return False
+        
+        attempts = max(1, self.max_retries if max_retries is None else max_retries)
+        delay = self.retry_delay
+        for attempt in range(attempts):
             try:
-                return strategy(error, context)
+                if strategy(error, context):
+                    return True
             except Exception as e:
                 logger.error(f"恢复策略失败: {e}")
+            
+            if attempt < attempts - 1:
+                time.sleep(delay)
+                delay *= 2
         
         return False
 
 
+def _ttl_cache(ttl: float = 1.0):
+    """ResourceMonitor 检查结果的短时缓存
+
+    资源状况以秒级变化，处理循环中频繁检查时在 ttl 内直接复用上次结果
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(self, *args):
+            key = (func.__name__,) + args
+            now = time.monotonic()
+            cached = self._check_cache.get(key)
+            if cached is not None and cached[0] > now:
+                return cached[1]
+            
+            value = func(self, *args)
+            self._check_cache[key] = (now + ttl, value)
+            return value
+        
+        return wrapper
+    return decorator
+
+
+@lru_cache(maxsize=None)
+def _cuda_total_memory(device: int = 0) -> int:
+    """显卡总显存（进程内不变，只查询一次）"""
+    return torch.cuda.get_device_properties(device).total_memory
+
+
 class ResourceMonitor:
     """资源监控器"""
     
@@ -209,12 +281,18 @@ class ResourceMonitor:
         self.min_free_disk_gb = min_free_disk_gb
         self.min_free_memory_gb = min_free_memory_gb
         self.min_free_vram_gb = min_free_vram_gb
+        self._check_cache = {}
+    
+    def invalidate(self):
+        """清除检查结果缓存，下次检查时重新查询"""
+        self._check_cache.clear()
     
+    @_ttl_cache()
     def check_disk_space(self, path: str) -> bool:
         """检查磁盘空间"""
         try:
-            stat = os.statvfs(path)
-            free_gb = (stat.f_bavail * stat.f_frsize) / (1024**3)
+            st = os.statvfs(path)
+            free_gb = (st.f_bavail * st.f_frsize) / (1024**3)
             
             if free_gb < self.min_free_disk_gb:
                 logger.warning(f"磁盘空间不足: {free_gb:.2f}GB < {self.min_free_disk_gb}GB")
@@ -224,30 +302,37 @@ class ResourceMonitor:
             logger.error(f"检查磁盘空间失败: {e}")
             return True  # 无法检查时默认通过
     
+    @_ttl_cache()
     def check_memory(self) -> bool:
         """检查系统内存"""
-        try:
-            import psutil
-            memory = psutil.virtual_memory()
-            free_gb = memory.available / (1024**3)
-            
-            if free_gb < self.min_free_memory_gb:
-                logger.warning(f"系统内存不足: {free_gb:.2f}GB < {self.min_free_memory_gb}GB")
-                return False
-            return True
-        except ImportError:
+        if psutil is None:
             return True
+        
+        memory = psutil.virtual_memory()
+        free_gb = memory.available / (1024**3)
+        
+        if free_gb < self.min_free_memory_gb:
+            logger.warning(f"系统内存不足: {free_gb:.2f}GB < {self.min_free_memory_gb}GB")
+            return False
+        return True
     
+    @_ttl_cache()
     def check_vram(self) -> bool:
         """检查显存"""
+        if torch is None:
+            return True
+        
         try:
-            import torch
             if not torch.cuda.is_available():
                 return True
             
-            free_gb = torch.cuda.get_device_properties(0).total_memory
-            free_gb -= torch.cuda.memory_allocated()
-            free_gb /= (1024**3)
+            try:
+                # 驱动层实际空闲显存（含缓存块、碎片及其他进程占用），一次调用
+                free_bytes, _ = torch.cuda.mem_get_info(0)
+            except AttributeError:
+                # 旧版 PyTorch 没有 mem_get_info
+                free_bytes = _cuda_total_memory(0) - torch.cuda.memory_allocated()
+            free_gb = free_bytes / (1024**3)
             
             if free_gb < self.min_free_vram_gb:
                 logger.warning(f"显存不足: {free_gb:.2f}GB < {self.min_free_vram_gb}GB")
@@ -279,20 +364,29 @@ class ResourceMonitor:
 class ValidationHelper:
     """验证辅助类"""
     
+    @staticmethod
+    def _stat_or_none(path: str) -> Optional[os.stat_result]:
+        """stat 一次，存在性、类型和大小都从结果中取得；不存在或无法访问时返回 None
+        （与 os.path.exists 一致：任何 OSError 及路径含 NUL 字符的 ValueError 都视为不存在）"""
+        try:
+            return os.stat(path)
+        except (OSError, ValueError):
+            return None
+    
     @staticmethod
     def validate_video_path(path: str) -> bool:
         """验证视频路径"""
         if not path or not isinstance(path, str):
             return False
         
-        if not os.path.exists(path):
+        st = ValidationHelper._stat_or_none(path)
+        if st is None or not stat.S_ISREG(st.st_mode):
             logger.error(f"视频文件不存在: {path}")
             return False
         
         # 检查扩展名
-        ext = Path(path).suffix.lower()
-        supported = ['.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm']
-        if ext not in supported:
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in _SUPPORTED_VIDEO_EXTS:
             logger.warning(f"不支持的格式: {ext}")
         
         return True
@@ -304,10 +398,11 @@ class ValidationHelper:
             return False
         
         if check_parent:
-            parent = Path(path).parent
-            if not parent.exists():
+            parent = os.path.dirname(path) or "."
+            st = ValidationHelper._stat_or_none(parent)
+            if st is None:
                 try:
-                    parent.mkdir(parents=True, exist_ok=True)
+                    os.makedirs(parent, exist_ok=True)
                 except Exception as e:
                     logger.error(f"无法创建输出目录: {e}")
                     return False
@@ -320,12 +415,13 @@ class ValidationHelper:
         if not path or not isinstance(path, str):
             return False
         
-        if not os.path.exists(path):
+        st = ValidationHelper._stat_or_none(path)
+        if st is None or not stat.S_ISREG(st.st_mode):
             logger.error(f"模型文件不存在: {path}")
             return False
         
         # 检查文件大小（模型文件通常很大）
-        size_mb = os.path.getsize(path) / (1024 * 1024)
+        size_mb = st.st_size / (1024 * 1024)
         if size_mb < 1:  # 小于1MB可能是错误的
             logger.warning(f"模型文件异常小: {size_mb:.2f}MB")
         
@@ -341,12 +437,9 @@ resource_monitor = ResourceMonitor()
 def recover_from_oom(error: MemoryError, context: dict = None) -> bool:
     """从OOM恢复"""
     try:
-        import torch
-        import gc
-        
         # 清理缓存
         gc.collect()
-        if torch.cuda.is_available():
+        if torch is not None and torch.cuda.is_available():
             torch.cuda.empty_cache()
         
         logger.info("已清理显存缓存")
@@ -7,14 +7,23 @@
 
 import os
 import logging
-from typing import Optional, Callable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Tuple, Iterable
 from pathlib import Path
 
+import numpy as np
+
 # 导入新的 RIFE 引擎
 try:
-    from .rife_engine import RIFEEngine, SimpleInterpolator
+    from .rife_engine import (
+        RIFEEngine, SimpleInterpolator, _link_or_copy, _list_png, _find_model_dir, _blend_frames,
+        _load_rgb
+    )
 except ImportError:
-    from rife_engine import RIFEEngine, SimpleInterpolator
+    from rife_engine import (
+        RIFEEngine, SimpleInterpolator, _link_or_copy, _list_png, _find_model_dir, _blend_frames,
+        _load_rgb
+    )
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +35,12 @@ class InterpolatorEngine:
     提供与旧代码兼容的接口，内部使用 RIFEEngine
     """
     
+    # 链接/复制重复帧时每批提交的任务数（每批完成后回调一次进度）
+    LINK_CHUNK_SIZE = 256
+    
+    # 直接编码时每批并行解码的帧数（解码完再按顺序写入编码器）
+    DECODE_CHUNK_SIZE = 8
+    
     # 目标帧率映射
     TARGET_FPS = {
         24: 60,  # 电影 → 60fps
@@ -54,6 +69,7 @@ class InterpolatorEngine:
         # 初始化新的 RIFE 引擎
         self._rife_engine = None
         self._simple_interpolator = None
+        self._link_pool = None
         
         self.target_fps = 60
         self._load_model()
@@ -85,21 +101,33 @@ class InterpolatorEngine:
             return True
         return self._simple_interpolator is not None or True  # 简单插值总是可用
     
+    def get_output_fps(self, source_fps: float) -> float:
+        """补帧后的输出帧率（与 interpolate_frames 返回的帧率一致，可在处理前用于打开编码器）"""
+        target_fps = self.TARGET_FPS.get(int(source_fps), 60)
+        if abs(target_fps - source_fps) < 0.01:
+            return source_fps
+        if self._rife_engine and self._rife_engine.is_available():
+            return self._rife_engine.calculate_interpolation_frames(source_fps, target_fps)[1]
+        return target_fps
+    
     def interpolate_frames(
         self,
         input_dir: str,
         output_dir: str,
         source_fps: float,
-        progress_callback: Optional[Callable[[int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        frame_writer: Optional[Callable] = None
     ) -> Tuple[int, float]:
         """
         补帧处理
         
         Args:
             input_dir: 输入帧目录
-            output_dir: 输出帧目录
+            output_dir: 输出帧目录（指定 frame_writer 时不使用）
             source_fps: 原始帧率
             progress_callback: 进度回调 (current, total)
+            frame_writer: 按输出顺序接收帧 (HWC RGB uint8) 的写入函数，
+                指定时帧直接送入编码器，不写 PNG 中间文件
             
         Returns:
             (输出帧数, 目标帧率)
@@ -107,6 +135,13 @@ class InterpolatorEngine:
         # 确定目标帧率
         target_fps = self.TARGET_FPS.get(int(source_fps), 60)
         
+        # 帧率不变时无需插值，直接透传帧
+        if abs(target_fps - source_fps) < 0.01:
+            logger.info(f"Source already at {source_fps}fps, passing frames through")
+            return self._simple_interpolate(
+                input_dir, output_dir, source_fps, target_fps, progress_callback, frame_writer
+            )
+        
         # 优先使用 RIFE 引擎
         if self._rife_engine and self._rife_engine.is_available():
             logger.info(f"Using RIFE engine for interpolation: {source_fps}fps → {target_fps}fps")
@@ -115,76 +150,174 @@ class InterpolatorEngine:
                 output_dir=output_dir,
                 source_fps=source_fps,
                 target_fps=target_fps,
-                progress_callback=progress_callback
+                progress_callback=progress_callback,
+                frame_writer=frame_writer
             )
         
         # 使用简单插值作为 fallback
         logger.info(f"Using simple interpolation: {source_fps}fps → {target_fps}fps")
         return self._simple_interpolate(
-            input_dir, output_dir, source_fps, target_fps, progress_callback
+            input_dir, output_dir, source_fps, target_fps, progress_callback, frame_writer
         )
     
+    def interpolate_stream(
+        self,
+        frames: Iterable[np.ndarray],
+        source_fps: float,
+        frame_writer: Callable[[np.ndarray], None],
+        total: Optional[int] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Tuple[int, float]:
+        """
+        对内存中的帧流补帧，结果按输出顺序直接交给 frame_writer（不读写 PNG 中间文件）
+        
+        目标帧率与 interpolate_frames / get_output_fps 一致；帧的通道顺序原样保留
+        
+        Args:
+            frames: 输入帧 (HWC uint8)
+            source_fps: 原始帧率
+            frame_writer: 输出帧写入函数
+            total: 输入总帧数（用于进度回调）
+            progress_callback: 进度回调 (current, total)
+            
+        Returns:
+            (输出帧数, 目标帧率)
+        """
+        target_fps = self.TARGET_FPS.get(int(source_fps), 60)
+        same_fps = abs(target_fps - source_fps) < 0.01
+        
+        if not same_fps and self._rife_engine and self._rife_engine.is_available():
+            logger.info(f"Using RIFE engine for interpolation: {source_fps}fps → {target_fps}fps")
+            return self._rife_engine.interpolate_stream(
+                frames,
+                frame_writer,
+                source_fps=source_fps,
+                target_fps=target_fps,
+                total=total,
+                progress_callback=progress_callback
+            )
+        
+        # 帧率不变时透传；否则简单重复帧（Fallback）
+        copies = 1 if same_fps else max(int(target_fps / source_fps) - 1, 0) + 1
+        count = 0
+        for count, frame in enumerate(frames, 1):
+            for _ in range(copies):
+                frame_writer(frame)
+            if progress_callback:
+                progress_callback(count, max(total or 0, count))
+        
+        return count * copies, source_fps if same_fps else target_fps
+    
     def _simple_interpolate(
         self,
         input_dir: str,
         output_dir: str,
         source_fps: float,
         target_fps: float,
-        progress_callback: Optional[Callable[[int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        frame_writer: Optional[Callable] = None
     ) -> Tuple[int, float]:
         """
         简单帧复制（Fallback）
-        当 RIFE 不可用时使用
+        当 RIFE 不可用时使用，重复帧以硬链接方式生成；
+        指定 frame_writer 时解码后按顺序直接写入编码器
         """
-        import shutil
-        
-        os.makedirs(output_dir, exist_ok=True)
-        input_frames = sorted(Path(input_dir).glob("*.png"))
+        if frame_writer is None:
+            os.makedirs(output_dir, exist_ok=True)
+        input_frames = _list_png(input_dir)
         
         if not input_frames:
             logger.error(f"No frames found in {input_dir}")
             return 0, source_fps
         
+        if frame_writer is not None:
+            same_fps = abs(target_fps - source_fps) < 0.01
+            copies = 1 if same_fps else max(int(target_fps / source_fps) - 1, 0) + 1
+            self._write_frames(input_dir, input_frames, copies, frame_writer, progress_callback)
+            return len(input_frames) * copies, source_fps if same_fps else target_fps
+        
+        # 帧率不变：保留原文件名整体链接到输出目录，不计算倍率
+        if abs(target_fps - source_fps) < 0.01:
+            if os.path.abspath(input_dir) != os.path.abspath(output_dir):
+                input_prefix = os.path.join(os.path.abspath(input_dir), "")
+                output_prefix = os.path.join(output_dir, "")
+                list(self._get_link_pool().map(
+                    _link_or_copy,
+                    [f"{input_prefix}{name}" for name in input_frames],
+                    [f"{output_prefix}{name}" for name in input_frames]
+                ))
+            
+            if progress_callback:
+                progress_callback(len(input_frames), len(input_frames))
+            return len(input_frames), source_fps
+        
         # 计算需要插入的帧数
         ratio = target_fps / source_fps
         n_duplicates = int(ratio) - 1
         
-        output_idx = 0
         total_input = len(input_frames)
+        copies = max(n_duplicates, 0) + 1
         
-        for i, frame in enumerate(input_frames):
-            # 复制原帧
-            shutil.copy(frame, os.path.join(output_dir, f"frame_{output_idx:08d}.png"))
-            output_idx += 1
-            
-            # 复制额外帧以达到目标帧率
-            for _ in range(n_duplicates):
-                shutil.copy(frame, os.path.join(output_dir, f"frame_{output_idx:08d}.png"))
-                output_idx += 1
+        # 原帧及额外的重复帧（以达到目标帧率），输出文件名预先确定
+        # 路径前缀只拼接一次，循环内仅做字符串格式化
+        input_prefix = os.path.join(os.path.abspath(input_dir), "")
+        output_prefix = os.path.join(output_dir, "frame_")
+        srcs = [f"{input_prefix}{name}" for name in input_frames for _ in range(copies)]
+        dsts = [f"{output_prefix}{idx:08d}.png" for idx in range(len(srcs))]
+        
+        # 链接/复制受系统调用延迟限制，用线程池并发提交
+        pool = self._get_link_pool()
+        output_idx = len(dsts)
+        for start in range(0, output_idx, self.LINK_CHUNK_SIZE):
+            end = min(start + self.LINK_CHUNK_SIZE, output_idx)
+            list(pool.map(_link_or_copy, srcs[start:end], dsts[start:end]))
             
             if progress_callback:
-                progress_callback(i + 1, total_input)
+                progress_callback((end + copies - 1) // copies, total_input)
         
         logger.info(f"Simple interpolation complete: {output_idx} frames")
         return output_idx, target_fps
     
+    def _write_frames(
+        self,
+        input_dir: str,
+        input_frames: list,
+        copies: int,
+        frame_writer: Callable,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ):
+        """按顺序解码帧并写入编码器，每帧重复 copies 次"""
+        input_prefix = os.path.join(input_dir, "")
+        paths = [f"{input_prefix}{name}" for name in input_frames]
+        total_input = len(paths)
+        
+        # 一批帧在线程池中并行解码（解码期间释放 GIL），写入保持原顺序
+        pool = self._get_link_pool()
+        for start in range(0, total_input, self.DECODE_CHUNK_SIZE):
+            end = min(start + self.DECODE_CHUNK_SIZE, total_input)
+            for img in pool.map(_load_rgb, paths[start:end]):
+                for _ in range(copies):
+                    frame_writer(img)
+            
+            if progress_callback:
+                progress_callback(end, total_input)
+    
+    def _get_link_pool(self) -> ThreadPoolExecutor:
+        """获取重复帧链接线程池（首次使用时创建，之后复用）"""
+        if self._link_pool is None:
+            self._link_pool = ThreadPoolExecutor(
+                max_workers=(os.cpu_count() or 1) * 2,
+                thread_name_prefix="frame-link"
+            )
+        return self._link_pool
+    
     def _find_model(self) -> Optional[str]:
         """查找 RIFE 模型"""
         if self._rife_engine:
             return self._rife_engine._find_model_path()
         
         # 向后兼容
-        search_paths = [
-            "models/rife/",
-            "~/.local/share/video-upscaler/models/rife/",
-        ]
-        
-        for path in search_paths:
-            path = os.path.expanduser(path)
-            if os.path.exists(path):
-                return path
-        
-        return None
+        return _find_model_dir()
     
     def get_memory_usage(self) -> dict:
         """获取显存使用情况"""
@@ -213,11 +346,7 @@ class InterpolatorEngine:
             return self._rife_engine.interpolate_frame_pair(img0, img1, timestep)
         
         # Fallback: 简单混合
-        import numpy as np
-        alpha = timestep
-        result = (img0.astype(np.float32) * (1 - alpha) + 
-                  img1.astype(np.float32) * alpha)
-        return result.clip(0, 255).astype(np.uint8)
+        return _blend_frames(img0, img1, timestep)
 
 
 # 便捷函数
@@ -243,10 +372,10 @@ def create_interpolator(
 if __name__ == "__main__":
     # 测试代码
     import tempfile
-    import numpy as np
     from PIL import Image
+    from buffered_log import install_buffered_stderr_handler
     
-    logging.basicConfig(level=logging.INFO)
+    install_buffered_stderr_handler()
     
     print("Interpolator Engine Test")
     print("=" * 50)
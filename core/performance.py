@@ -2,14 +2,37 @@
 性能优化工具
 多线程解码和CPU优化
 """
+import math
 import os
 import multiprocessing
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from typing import List, Callable, Optional
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Callable, Optional, Tuple, Iterable
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 编译产物（TensorRT 引擎等）缓存目录
+CACHE_DIR = Path.home() / ".cache" / "video-upscaler"
+
+# 可扩展显存段：缓存分配器按需增长/复用，推理尺寸变化时不产生碎片，处理过程中
+# 无需周期性 empty_cache，只在整个任务结束时释放（需在 CUDA 初始化前设置，
+# 本模块由各推理引擎在导入 torch 之前导入；用户已设置时不覆盖）
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
+# 缓存分配器可占用的显存比例：超出时在进程内抛出 OOM（由推理引擎缩小 tile 重试），
+# 而不是由驱动溢出到共享内存（Windows WDDM 下会静默变慢）
+CUDA_MEMORY_FRACTION = 0.9
+
+
+def _limit_blas_threads():
+    """进程池工作进程初始化：BLAS/OpenMP 只用单线程，避免与进程池本身的并行叠加超额订阅"""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = "1"
+
 
 class PerformanceOptimizer:
     """性能优化器"""
@@ -36,27 +59,48 @@ class PerformanceOptimizer:
         else:
             return self.cpu_workers
     
-    def optimize_ffmpeg_args(self, base_args: List[str], preset: str = "medium") -> List[str]:
+    def optimize_ffmpeg_args(
+        self,
+        base_args: List[str],
+        preset: str = "medium",
+        hwaccel: Optional[str] = "auto"
+    ) -> List[str]:
         """优化FFmpeg参数以获得更好性能
         
         Args:
             base_args: 基础FFmpeg参数
             preset: 编码预设 (ultrafast, superfast, veryfast, faster, fast, medium, slow)
+            hwaccel: 硬件解码方式（"auto" 有 NVDEC 等硬件解码器时使用，否则回退软件解码；
+                None 不启用）
         
         Returns:
             优化后的参数列表
         """
-        optimized = base_args.copy()
+        optimized = list(base_args)
+        flags = set(optimized)
+        has_input = "-i" in flags
+        
+        # 解码选项须位于第一个 -i 之前才作用于输入
+        input_opts = []
+        if has_input and hwaccel and "-hwaccel" not in flags:
+            input_opts.extend(["-hwaccel", hwaccel])
+        if has_input and "-thread_type" not in flags:
+            # 对于解码，使用多线程
+            input_opts.extend(["-thread_type", "slice"])
         
-        # 添加线程优化
-        if "-threads" not in " ".join(optimized):
-            optimized.extend(["-threads", str(self.cpu_workers)])
+        # 编码线程数须位于输出路径之前（位于末尾会被 FFmpeg 当作无效的尾随参数忽略）
+        output_opts = []
+        if "-threads" not in flags:
+            output_opts.extend(["-threads", str(self.cpu_workers)])
         
-        # 对于解码，使用多线程
-        if any(arg in optimized for arg in ["-i", "-c:v"]):
-            if "-thread_type" not in " ".join(optimized):
-                optimized.insert(-2 if optimized[-1].startswith("-") else -1, "-thread_type")
-                optimized.insert(-2 if optimized[-1].startswith("-") else -1, "slice")
+        if input_opts:
+            idx = optimized.index("-i")
+            optimized[idx:idx] = input_opts
+        if output_opts:
+            if optimized and not optimized[-1].startswith("-"):
+                optimized[-1:-1] = output_opts
+            else:
+                optimized.extend(output_opts)
         
         return optimized
     
@@ -65,34 +109,41 @@ class PerformanceOptimizer:
         items: List,
         process_func: Callable,
         max_workers: Optional[int] = None,
-        use_processes: bool = False
+        use_processes: bool = False,
+        task_type: Optional[str] = None
     ):
         """并行处理列表项
         
         Args:
             items: 要处理的项列表
             process_func: 处理函数
-            max_workers: 最大工作进程数
-            use_processes: 是否使用进程池（CPU密集型任务）
+            max_workers: 最大工作进程数，默认按 task_type 取 get_optimal_workers
+            use_processes: 是否使用进程池（未指定 task_type 时等同于 "cpu"）
+            task_type: "cpu" | "gpu" | "io"，仅 "cpu" 使用进程池，
+                其余使用线程池（无需 pickle 帧数据）
         
         Returns:
-            处理结果列表
+            处理结果列表（与 items 顺序一致，失败项为 None）
         """
+        if task_type is None:
+            task_type = "cpu" if use_processes else "io"
         if max_workers is None:
-            max_workers = self.cpu_workers if use_processes else self.io_workers
+            max_workers = self.get_optimal_workers(task_type)
         
-        Executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        if task_type == "cpu":
+            executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_limit_blas_threads)
+        else:
+            executor = ThreadPoolExecutor(max_workers=max_workers)
         
-        results = []
-        with Executor(max_workers=max_workers) as executor:
-            futures = [executor.submit(process_func, item) for item in items]
-            for future in futures:
+        results = [None] * len(items)
+        with executor:
+            futures = {executor.submit(process_func, item): idx for idx, item in enumerate(items)}
+            # 按完成顺序收集，慢任务不阻塞其他结果
+            for future in as_completed(futures):
                 try:
-                    result = future.result()
-                    results.append(result)
+                    results[futures[future]] = future.result()
                 except Exception as e:
                     logger.error(f"Parallel processing error: {e}")
-                    results.append(None)
         
         return results
     
@@ -126,32 +177,95 @@ class PerformanceOptimizer:
 
 
 class FrameBuffer:
-    """帧缓冲区 - 用于异步IO优化"""
+    """帧缓冲区 - 用于异步IO优化
+
+    基于有界 queue.Queue：缓冲区满时 put 阻塞等待，不再轮询
+    """
     
     def __init__(self, max_size: int = 100):
         self.max_size = max_size
-        self.buffer = []
-        self._lock = False
+        self._q = queue.Queue(maxsize=max_size)
         
     def put(self, frame):
-        """放入帧"""
-        while len(self.buffer) >= self.max_size:
-            import time
-            time.sleep(0.001)  # 短暂等待
-        self.buffer.append(frame)
-    
-    def get(self):
-        """获取帧"""
-        if self.buffer:
-            return self.buffer.pop(0)
-        return None
+        """放入帧（缓冲区满时阻塞）"""
+        self._q.put(frame)
+    
+    def get(self, timeout: Optional[float] = None):
+        """获取帧
+
+        Args:
+            timeout: 等待秒数，None 表示不等待
+        
+        Returns:
+            帧，缓冲区为空（或等待超时）时返回 None
+        """
+        try:
+            if timeout is None:
+                return self._q.get_nowait()
+            return self._q.get(timeout=timeout)
+        except queue.Empty:
+            return None
     
     def clear(self):
         """清空缓冲区"""
-        self.buffer.clear()
+        try:
+            while True:
+                self._q.get_nowait()
+        except queue.Empty:
+            pass
     
     def __len__(self):
-        return len(self.buffer)
+        return self._q.qsize()
+
+
+class FramePipe:
+    """帧管道 - 连接逐帧写入的上游阶段与按迭代读取的下游阶段（各在一个线程中）
+
+    基于有界 queue.Queue：下游处理慢时 write 阻塞，限制内存中的在途帧数；
+    上游 close() 结束下游迭代，abort() 令下游迭代抛出异常；
+    下游 cancel() 后上游 write 抛出异常，不再阻塞
+    """
+    
+    _END = object()
+    
+    def __init__(self, max_size: int = 8):
+        self._q = queue.Queue(maxsize=max_size)
+        self._cancelled = threading.Event()
+    
+    def _put(self, item) -> bool:
+        while not self._cancelled.is_set():
+            try:
+                self._q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def write(self, frame):
+        """写入一帧（管道满时阻塞）"""
+        if not self._put(frame):
+            raise RuntimeError("Frame pipe consumer stopped")
+    
+    def close(self):
+        """上游正常结束"""
+        self._put(self._END)
+    
+    def abort(self, error: Optional[BaseException] = None):
+        """上游异常结束：下游迭代抛出 error"""
+        self._put(error or RuntimeError("Frame pipe aborted"))
+    
+    def cancel(self):
+        """下游提前退出：上游后续 write 立即失败"""
+        self._cancelled.set()
+    
+    def __iter__(self):
+        while True:
+            item = self._q.get()
+            if item is self._END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
 
 
 class AsyncIOProcessor:
@@ -179,13 +293,14 @@ class AsyncIOProcessor:
         self.executor.shutdown(wait=wait)
 
 
+@lru_cache(maxsize=64)
 def get_optimal_tile_size(
     image_width: int,
     image_height: int,
     available_memory_gb: float,
     scale: int = 4
 ) -> int:
-    """根据可用显存计算最佳tile大小
+    """根据可用显存计算最佳tile大小（纯函数，按参数缓存，逐帧调用时不重复计算）
     
     Args:
         image_width: 图片宽度
@@ -208,7 +323,6 @@ def get_optimal_tile_size(
     
     if estimated_mb > safe_mb:
         # 需要分块
-        import math
         # 计算需要的块数
         n_tiles = math.ceil(estimated_mb / safe_mb)
         tile_pixels = pixels / n_tiles
@@ -223,6 +337,174 @@ def get_optimal_tile_size(
     return 0  # 不需要分块
 
 
+@lru_cache(maxsize=1)
+def configure_cuda_backends():
+    """开启 CUDA 推理加速开关（进程内只需设置一次，由各推理引擎在加载模型时调用）
+
+    - cudnn.benchmark：视频帧尺寸固定，首次按形状自动挑选最快的卷积算法
+    - TF32：Ampere 及以上显卡上 float32 卷积/矩阵乘走张量核心
+    - 显存上限：缓存分配器最多占用 CUDA_MEMORY_FRACTION
+    """
+    import torch
+
+    torch.cuda.set_per_process_memory_fraction(CUDA_MEMORY_FRACTION, torch.cuda.current_device())
+
+    torch.backends.cudnn.benchmark = True
+    torch.backends.cudnn.allow_tf32 = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.set_float32_matmul_precision("high")
+
+
+def to_channels_last(module):
+    """将模型权重转换为 channels_last (NHWC) 布局，卷积可直接使用 NHWC 内核，省去布局转换"""
+    import torch
+
+    return module.to(memory_format=torch.channels_last)
+
+
+class _CompiledModule:
+    """torch.compile 结果的包装：编译或编译后执行失败时只让该模型退回 eager，并记录 WARNING
+
+    不修改 torch._dynamo.config.suppress_errors 等全局开关，其他模型的编译失败不受影响；
+    显存不足不视为编译失败，原样抛出交给调用方处理；其余属性访问转发给原模型
+    """
+
+    def __init__(self, module, compiled):
+        self._module = module
+        self._compiled = compiled
+
+    def __call__(self, *args, **kwargs):
+        import torch
+
+        if self._compiled is not None:
+            try:
+                return self._compiled(*args, **kwargs)
+            except torch.cuda.OutOfMemoryError:
+                raise
+            except Exception as e:
+                logger.warning(
+                    f"torch.compile failed for {type(self._module).__name__}, using eager mode: {e}"
+                )
+                self._compiled = None
+        return self._module(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+def download_async(frames, stream=None) -> Callable[[], list]:
+    """将 NHWC uint8 帧张量异步拷回主机，返回取结果的函数（结果为逐帧 numpy 数组列表）
+
+    CUDA 张量在 stream（调用方持有的下载流）上拷入页锁定内存（由 PyTorch 页锁定缓存分配器复用），
+    拷贝与当前流上后续的推理重叠，取结果时只等待本批拷贝完成的事件；CPU 张量直接返回
+    """
+    import torch
+
+    if not frames.is_cuda:
+        host = frames.numpy()
+        return lambda: list(host)
+
+    stream.wait_stream(torch.cuda.current_stream())
+    host = torch.empty(frames.shape, dtype=torch.uint8, pin_memory=True)
+    with torch.cuda.stream(stream):
+        host.copy_(frames, non_blocking=True)
+        event = torch.cuda.Event()
+        event.record()
+    frames.record_stream(stream)
+
+    def result() -> list:
+        event.synchronize()
+        # 返回的帧是页锁定缓冲的视图，帧被释放后缓冲才回到缓存
+        return list(host.numpy())
+
+    return result
+
+
+def compile_module(module, mode: str = "reduce-overhead", dynamic: Optional[bool] = None):
+    """用 torch.compile 编译模型前向（算子融合，reduce-overhead 模式下以 CUDA Graph 消除逐次启动开销）
+
+    dynamic=False 按每种输入形状单独特化编译（输入形状固定时生成的内核最快），
+    None 由 PyTorch 在形状变化时自动切换为动态形状
+
+    torch < 2.0 或编译不可用时原样返回；编译是惰性的，首次调用时编译失败则该模型退回 eager 执行
+    """
+    import torch
+
+    if not hasattr(torch, "compile"):
+        return module
+    try:
+        compiled = torch.compile(module, mode=mode, fullgraph=False, dynamic=dynamic)
+    except Exception as e:
+        logger.warning(f"torch.compile unavailable, using eager mode: {e}")
+        return module
+    return _CompiledModule(module, compiled)
+
+
+def compile_tensorrt(
+    module,
+    min_shape: Tuple[int, ...],
+    opt_shape: Tuple[int, ...],
+    max_shape: Tuple[int, ...],
+    cache_path: Path,
+    dtype=None,
+    enabled_precisions: Optional[Iterable] = None,
+    calibrator=None
+):
+    """用 Torch-TensorRT 将模型编译为 TensorRT 引擎（层融合 + 按显卡挑选内核）
+    
+    编译结果序列化为 TorchScript 缓存到 cache_path，之后直接加载，不再重复编译；
+    输入形状在 [min_shape, max_shape] 内可变（边缘 tile 小于完整 tile）
+    
+    Args:
+        module: 待编译模型（CUDA 上，权重精度与 dtype 一致）
+        min_shape / opt_shape / max_shape: NCHW 输入形状范围，opt_shape 为主要优化形状
+        cache_path: 序列化引擎路径
+        dtype: 输入精度，默认 torch.half
+        enabled_precisions: 允许 TensorRT 使用的精度，默认 {dtype}
+        calibrator: INT8 校准器（enabled_precisions 含 torch.int8 时需要）
+    
+    Returns:
+        可直接替换原模型调用的 TensorRT 模块
+    
+    Raises:
+        ImportError: 未安装 torch_tensorrt 且无缓存
+    """
+    import torch
+
+    dtype = dtype or torch.half
+    cache_path = Path(cache_path)
+    if cache_path.exists():
+        try:
+            return torch.jit.load(str(cache_path), map_location="cuda")
+        except Exception as e:
+            logger.warning(f"Failed to load TensorRT cache {cache_path}, rebuilding: {e}")
+
+    import torch_tensorrt
+
+    # TorchScript 前端：先按主要形状 trace，TensorRT 再按形状范围生成动态引擎
+    example = torch.zeros(opt_shape, dtype=dtype, device="cuda")
+    with torch.no_grad():
+        scripted = torch.jit.trace(module, example)
+
+    options = {}
+    if calibrator is not None:
+        options["calibrator"] = calibrator
+    trt_module = torch_tensorrt.compile(
+        scripted,
+        ir="ts",
+        inputs=[torch_tensorrt.Input(
+            min_shape=min_shape, opt_shape=opt_shape, max_shape=max_shape, dtype=dtype
+        )],
+        enabled_precisions=set(enabled_precisions or {dtype}),
+        **options
+    )
+
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    torch.jit.save(trt_module, str(cache_path))
+    logger.info(f"TensorRT engine cached to {cache_path}")
+    return trt_module
+
+
 # 全局性能优化器实例
 optimizer = PerformanceOptimizer()
 
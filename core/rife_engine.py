@@ -4,17 +4,175 @@ RIFE 补帧引擎
 支持 24/25/30fps → 60fps
 """
 
+import errno
 import os
 import sys
 import logging
 import gc
+import queue
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Callable, Tuple, List
+from typing import Optional, Callable, Tuple, List, Iterable
+import cv2
 import numpy as np
 from PIL import Image
 
+try:
+    from .performance import configure_cuda_backends, to_channels_last, compile_module, download_async
+except ImportError:
+    from performance import configure_cuda_backends, to_channels_last, compile_module, download_async
+
 logger = logging.getLogger(__name__)
 
+# 补帧循环中每处理多少输入帧输出一次进度日志
+PROGRESS_LOG_EVERY = 512
+
+
+# RIFE 模型文件与目录的默认搜索位置（展开一次）
+_MODEL_FILE_SEARCH_PATHS = tuple(os.path.expanduser(p) for p in (
+    "models/rife/rife.pth",
+    "models/rife/rife4.6.pth",
+    "models/rife/RIFE.pth",
+    "~/.local/share/video-upscaler/models/rife/rife.pth",
+    "/usr/local/share/video-upscaler/models/rife/rife.pth",
+))
+
+_MODEL_DIR_SEARCH_PATHS = tuple(os.path.expanduser(p) for p in (
+    "models/rife/",
+    "~/.local/share/video-upscaler/models/rife/",
+))
+
+
+@lru_cache(maxsize=1)
+def _find_default_model() -> Optional[str]:
+    """在默认位置查找 RIFE 模型文件（结果缓存，下载模型后需 cache_clear）"""
+    found = next((p for p in _MODEL_FILE_SEARCH_PATHS if os.path.exists(p)), None)
+    if found:
+        return found
+    
+    # 搜索 models/rife/ 目录
+    try:
+        with os.scandir("models/rife") as it:
+            for entry in it:
+                if entry.name.endswith(".pth"):
+                    return entry.path
+    except OSError:
+        pass
+    
+    return None
+
+
+@lru_cache(maxsize=1)
+def _find_model_dir() -> Optional[str]:
+    """在默认位置查找 RIFE 模型目录（结果缓存，下载模型后需 cache_clear）"""
+    return next((p for p in _MODEL_DIR_SEARCH_PATHS if os.path.isdir(p)), None)
+
+
+@lru_cache(maxsize=1)
+def _frame_transforms():
+    """
+    帧格式转换函数 (preprocess, postprocess)，首次使用时以 TorchScript 编译
+    
+    - preprocess: NHWC uint8 -> NCHW 模型精度 (float16/bfloat16/float32) [0, 1]
+      （由 permute 得到，内存布局即 channels_last，与 channels_last 权重直接匹配）
+    - postprocess: NCHW [0, 1] -> NHWC uint8（连续内存）
+    维度变换、类型转换与缩放合并为一个图，由 JIT 融合为单个内核
+    """
+    import torch
+    
+    def preprocess(x: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+        return x.permute(0, 3, 1, 2).to(dtype).mul(1.0 / 255.0)
+    
+    def postprocess(x: torch.Tensor) -> torch.Tensor:
+        x = x.mul(255.0).clamp(0.0, 255.0).to(torch.uint8)
+        return x.permute(0, 2, 3, 1).contiguous()
+    
+    try:
+        return torch.jit.script(preprocess), torch.jit.script(postprocess)
+    except Exception as e:
+        logger.debug(f"TorchScript unavailable for frame transforms, using eager mode: {e}")
+        return preprocess, postprocess
+
+
+def _frame_sort_key(name: str) -> Tuple[int, str]:
+    """帧文件排序键：按文件名末尾的帧序号（frame_00000012.png -> 12）数值排序
+
+    序号位数超过补零宽度时仍保持正确顺序；无序号的文件排在最后并按名称排序
+    """
+    stem = name[:-4] if name.endswith(".png") else name
+    digits = stem.rsplit("_", 1)[-1]
+    if digits.isdigit():
+        return int(digits), ""
+    return sys.maxsize, name
+
+
+def _list_png(input_dir: str) -> List[str]:
+    """列出目录下的 PNG 文件名（按帧序号排序），直接读取目录项，不逐个 stat"""
+    with os.scandir(input_dir) as it:
+        names = [entry.name for entry in it if entry.name.endswith(".png")]
+    names.sort(key=_frame_sort_key)
+    return names
+
+
+def _blend_frames(img0: np.ndarray, img1: np.ndarray, alpha: float) -> np.ndarray:
+    """线性混合两帧：img0 * (1 - alpha) + img1 * alpha"""
+    if img0.shape == img1.shape and img0.dtype == np.uint8 and img1.dtype == np.uint8:
+        # 单次 SIMD 遍历完成乘加、饱和与类型转换，无浮点临时数组
+        return cv2.addWeighted(img0, 1.0 - alpha, img1, alpha, 0.0, dtype=cv2.CV_8U)
+    
+    result = (img0.astype(np.float32) * (1 - alpha) + 
+              img1.astype(np.float32) * alpha)
+    return result.clip(0, 255).astype(np.uint8)
+
+
+# 中间帧 PNG 压缩级别：中间文件只需无损，不追求体积（PIL 默认 6，编码慢数倍）
+PNG_COMPRESS_LEVEL = 1
+
+
+def _load_rgb(path: str) -> np.ndarray:
+    """读取帧（在 I/O 线程池中执行，解码期间会释放 GIL）"""
+    return np.array(Image.open(path))
+
+
+def _save_png(img: np.ndarray, path: str):
+    """保存 PNG（在 I/O 线程池中执行，zlib 压缩期间会释放 GIL）"""
+    Image.fromarray(img).save(path, compress_level=PNG_COMPRESS_LEVEL)
+
+
+def _wait_writes(futures: list):
+    """等待写出任务完成，失败的帧只记录日志"""
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"Failed to save interpolated frame: {e}")
+
+
+def _link_or_copy(src: str, dst: str):
+    """
+    将 src 放到 dst 位置（重复帧内容完全相同，无需真正复制数据）
+    优先硬链接；跨设备时改用符号链接；都不可用时才复制文件
+    """
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        # 与复制一样覆盖已有的输出（如重复处理同一目录）
+        os.unlink(dst)
+        return _link_or_copy(src, dst)
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            try:
+                os.symlink(os.path.abspath(src), dst)
+                return
+            except OSError:
+                pass
+    shutil.copy(src, dst)
+
 
 class RIFEEngine:
     """
@@ -33,12 +191,20 @@ class RIFEEngine:
         60: 60,  # 已经是60fps
     }
     
+    # 默认每批推理的相邻帧对数量
+    BATCH_PAIRS = 4
+    
+    # 后台预读的批数
+    PREFETCH_BATCHES = 2
+    
     def __init__(
         self,
         model_path: Optional[str] = None,
         device: str = "cuda",
         use_fp16: bool = True,
-        scale: float = 1.0
+        use_bf16: bool = False,
+        scale: float = 1.0,
+        batch_size: Optional[int] = None
     ):
         """
         初始化 RIFE 引擎
@@ -47,19 +213,40 @@ class RIFEEngine:
             model_path: RIFE 模型路径
             device: 计算设备 (cuda/cpu)
             use_fp16: 使用半精度浮点数
+            use_bf16: 显卡支持时使用 bfloat16（数值范围同 float32，不易溢出），优先于 use_fp16
             scale: 缩放因子 (用于处理大分辨率)
+            batch_size: 每批推理的相邻帧对数量，默认 BATCH_PAIRS
         """
         self.model_path = model_path
         self.device = device
         self.use_fp16 = use_fp16
+        self.use_bf16 = use_bf16
         self.scale = scale
+        self.batch_size = max(1, batch_size or self.BATCH_PAIRS)
         self.model = None
         self.is_loaded = False
         
+        # 模型权重与输入张量的精度（load_model 时确定）
+        self._dtype = None
+        
         # 模型参数
         self.model_scale = 1.0  # RIFE 模型缩放
         
-        logger.info(f"RIFE Engine initialized (device={device}, fp16={use_fp16})")
+        # 主机到显卡传输用的页锁定 uint8 缓冲（按帧尺寸懒分配，两帧轮换）
+        self._pinned = []
+        self._pinned_events = []
+        self._pinned_idx = 0
+        
+        # 帧读取/写出线程池（首次使用时创建）
+        self._io_pool = None
+        
+        # 主机到显卡拷贝专用 CUDA 流（首次使用时创建），与计算流重叠
+        self._copy_stream = None
+        
+        # 显卡到主机拷贝专用 CUDA 流（首次使用时创建），结果拷回与下一批推理重叠
+        self._download_stream = None
+        
+        logger.info(f"RIFE Engine initialized (device={device}, fp16={use_fp16}, bf16={use_bf16})")
     
     def load_model(self) -> bool:
         """
@@ -93,6 +280,16 @@ class RIFEEngine:
                 self.model.eval()
                 self.model.device()
                 
+                self._dtype = self._select_dtype(torch)
+                if self.device == "cuda":
+                    configure_cuda_backends()
+                    # 权重一次性转为推理精度，输入上传时直接转换为同一精度，逐帧不再转换
+                    # 输入帧本身即 NHWC 布局，权重同样转为 channels_last（CPU 上无收益，跳过）
+                    flownet = getattr(self.model, "flownet", None)
+                    if flownet is not None:
+                        flownet = to_channels_last(flownet.to(dtype=self._dtype))
+                        self.model.flownet = compile_module(flownet)
+                
             except ImportError:
                 logger.warning("practical-RIFE not available")
                 return False
@@ -105,32 +302,24 @@ class RIFEEngine:
             logger.error(f"Failed to load RIFE model: {e}")
             return False
     
+    def _select_dtype(self, torch) -> 'torch.dtype':
+        """确定推理精度：CPU 固定 float32；CUDA 下 bf16（需显卡支持）> fp16 > fp32"""
+        if self.device != "cuda":
+            return torch.float32
+        if self.use_bf16 and torch.cuda.is_bf16_supported():
+            return torch.bfloat16
+        if self.use_fp16:
+            return torch.float16
+        return torch.float32
+    
     def _find_model_path(self) -> Optional[str]:
         """查找 RIFE 模型文件"""
-        # 常见模型路径
-        search_paths = [
-            self.model_path,
-            "models/rife/rife.pth",
-            "models/rife/rife4.6.pth",
-            "models/rife/RIFE.pth",
-            "~/.local/share/video-upscaler/models/rife/rife.pth",
-            "/usr/local/share/video-upscaler/models/rife/rife.pth",
-        ]
+        if self.model_path:
+            path = os.path.expanduser(self.model_path)
+            if os.path.exists(path):
+                return path
         
-        for path in search_paths:
-            if path:
-                path = os.path.expanduser(path)
-                if os.path.exists(path):
-                    return path
-        
-        # 搜索 models/rife/ 目录
-        rife_dir = Path("models/rife")
-        if rife_dir.exists():
-            pth_files = list(rife_dir.glob("*.pth"))
-            if pth_files:
-                return str(pth_files[0])
-        
-        return None
+        return _find_default_model()
     
     def is_available(self) -> bool:
         """检查补帧是否可用"""
@@ -190,21 +379,16 @@ class RIFEEngine:
         """
         if not self.is_available():
             # Fallback: 返回线性混合
-            return ((img0.astype(np.float32) + img1.astype(np.float32)) / 2).astype(np.uint8)
+            return _blend_frames(img0, img1, 0.5)
         
         try:
             import torch
             
-            # 转换格式
-            img0_tensor = self._to_tensor(img0)
-            img1_tensor = self._to_tensor(img1)
+            # 两帧一次上传；类型转换与归一化在设备上完成，直接得到模型精度的张量
+            frames = self._to_tensor(np.stack((img0, img1)))
+            img0_tensor, img1_tensor = frames[0:1], frames[1:2]
             
             with torch.no_grad():
-                # 推理
-                if self.use_fp16:
-                    img0_tensor = img0_tensor.half()
-                    img1_tensor = img1_tensor.half()
-                
                 # 调用模型
                 interp_frame = self.model.inference(img0_tensor, img1_tensor, timestep)
                 
@@ -216,31 +400,212 @@ class RIFEEngine:
         except Exception as e:
             logger.error(f"Interpolation failed: {e}")
             # Fallback
-            return ((img0.astype(np.float32) + img1.astype(np.float32)) / 2).astype(np.uint8)
+            return _blend_frames(img0, img1, 0.5)
     
     def _to_tensor(self, img: np.ndarray) -> 'torch.Tensor':
-        """将 numpy 图像转换为 tensor"""
+        """将 numpy 图像 (HWC 或 NHWC uint8) 转换为 tensor (NCHW，[0, 1])
+
+        以 uint8 传输到设备（字节数为 float32 的 1/4），
+        维度变换、类型转换和归一化都在设备上完成
+        """
         import torch
         
-        # HWC -> CHW
-        img = np.transpose(img, (2, 0, 1))
-        # 归一化到 [0, 1]
-        img = img.astype(np.float32) / 255.0
-        # 添加 batch 维度
-        img = np.expand_dims(img, axis=0)
+        src = torch.from_numpy(np.ascontiguousarray(img))
+        if src.dim() == 3:
+            src = src.unsqueeze(0)
         
-        tensor = torch.from_numpy(img).to(self.device)
-        return tensor
+        if self.device == "cuda":
+            # 经页锁定缓冲异步拷贝；复用缓冲前等待其上一次拷贝完成
+            if not self._pinned or self._pinned[0].shape != src.shape:
+                self._pinned = [
+                    torch.empty(src.shape, dtype=torch.uint8, pin_memory=True)
+                    for _ in range(2)
+                ]
+                self._pinned_events = [None, None]
+            idx = self._pinned_idx
+            self._pinned_idx = 1 - idx
+            if self._pinned_events[idx] is not None:
+                self._pinned_events[idx].synchronize()
+            
+            pinned = self._pinned[idx]
+            pinned.copy_(src)
+            
+            # 在拷贝流上上传，计算流仅在使用前等待，不阻塞此前已排队的推理
+            if self._copy_stream is None:
+                self._copy_stream = torch.cuda.Stream()
+            compute_stream = torch.cuda.current_stream()
+            with torch.cuda.stream(self._copy_stream):
+                src = pinned.to(self.device, non_blocking=True)
+                event = torch.cuda.Event()
+                event.record()
+            compute_stream.wait_stream(self._copy_stream)
+            src.record_stream(compute_stream)
+            self._pinned_events[idx] = event
+        
+        preprocess, _ = _frame_transforms()
+        return preprocess(src, self._dtype or torch.float32)
     
     def _to_numpy(self, tensor: 'torch.Tensor') -> np.ndarray:
-        """将 tensor 转换为 numpy 图像"""
-        # 移除 batch 维度
-        img = tensor.squeeze(0).cpu().numpy()
-        # CHW -> HWC
-        img = np.transpose(img, (1, 2, 0))
-        # 反归一化到 [0, 255]
-        img = (img * 255.0).clip(0, 255).astype(np.uint8)
-        return img
+        """将 tensor (1CHW，[0, 1]) 转换为 numpy 图像 (HWC uint8)"""
+        return self._to_numpy_batch(tensor)[0]
+    
+    def _to_numpy_batch(self, tensor: 'torch.Tensor') -> np.ndarray:
+        """将 tensor (NCHW，[0, 1]) 转换为 numpy 图像 (NHWC uint8)
+
+        先在设备上量化为 uint8 再一次性拷回主机
+        """
+        _, postprocess = _frame_transforms()
+        return postprocess(tensor).cpu().numpy()
+    
+    def interpolate_batch(
+        self,
+        imgs: List[np.ndarray],
+        timesteps: Tuple[float, ...] = (0.5,)
+    ) -> List[np.ndarray]:
+        """
+        对连续帧序列中的所有相邻帧对批量插值
+        
+        K 帧组成 K-1 个帧对，所有帧对与时间点合并为一个 batch，只调用一次模型
+        
+        Args:
+            imgs: 连续帧列表 (HWC uint8，尺寸一致)
+            timesteps: 插值时间点 (0-1)
+            
+        Returns:
+            插值帧列表，按帧对顺序排列，每个帧对内按 timesteps 顺序
+        """
+        return self.interpolate_batch_async(imgs, timesteps)()
+    
+    def interpolate_batch_async(
+        self,
+        imgs: List[np.ndarray],
+        timesteps: Tuple[float, ...] = (0.5,)
+    ) -> Callable[[], List[np.ndarray]]:
+        """
+        提交一批插值，立即返回取结果的函数（参数与结果同 interpolate_batch）
+        
+        CUDA 下推理与结果拷回都只在流上排队：调用方先提交下一批再取回本批结果，
+        本批的显卡到主机拷贝即与下一批推理重叠
+        """
+        if len(imgs) < 2:
+            return list
+        
+        if self.is_available():
+            try:
+                return self._download_async(self._infer_batch(imgs, timesteps))
+            except Exception as e:
+                logger.error(f"Batch interpolation failed: {e}, falling back to per-pair")
+        
+        results = [
+            self.interpolate_frame_pair(imgs[i], imgs[i + 1], t)
+            for i in range(len(imgs) - 1)
+            for t in timesteps
+        ]
+        return lambda: results
+    
+    def _infer_batch(
+        self,
+        imgs: List[np.ndarray],
+        timesteps: Tuple[float, ...]
+    ) -> 'torch.Tensor':
+        """上传帧并推理，返回设备上的插值结果 (NCHW，按帧对、时间点顺序)"""
+        import torch
+        
+        frames = self._to_tensor(np.stack(imgs))
+        img0, img1 = frames[:-1], frames[1:]
+        
+        with torch.no_grad():
+            if len(timesteps) == 1:
+                return self.model.inference(img0, img1, timesteps[0])
+            
+            # 多个时间点沿 batch 维展开（按帧对排列），整批只调用一次模型
+            n_t = len(timesteps)
+            t = torch.tensor(timesteps, device=frames.device, dtype=frames.dtype)
+            t = t.repeat(img0.shape[0]).view(-1, 1, 1, 1)
+            try:
+                return self.model.inference(
+                    img0.repeat_interleave(n_t, dim=0),
+                    img1.repeat_interleave(n_t, dim=0),
+                    t
+                )
+            except (TypeError, RuntimeError) as e:
+                # 旧版模型不支持张量时间点（或显存不足）：逐时间点推理
+                logger.debug(f"Batched timesteps unsupported, running per timestep: {e}")
+                outputs = [self.model.inference(img0, img1, ts) for ts in timesteps]
+                # (T, K-1, ...) -> (K-1, T, ...) -> 按帧对展开
+                return torch.stack(outputs, dim=1).flatten(0, 1)
+    
+    def _download_async(self, tensor: 'torch.Tensor') -> Callable[[], List[np.ndarray]]:
+        """在设备上量化为 uint8 后异步拷回主机，返回取结果的函数（见 download_async）"""
+        import torch
+        
+        _, postprocess = _frame_transforms()
+        frames = postprocess(tensor)
+        if frames.is_cuda and self._download_stream is None:
+            self._download_stream = torch.cuda.Stream()
+        return download_async(frames, self._download_stream)
+    
+    def _prefetch_batches(self, frame_paths: List[str], read_images: bool = True):
+        """
+        后台线程按批预读帧，解码与推理重叠
+        
+        逐批生成 (start, end, imgs)：imgs 为 start..min(end, 总数-1) 的帧，
+        无帧对或 read_images=False 时为 None，读取失败时为异常对象
+        """
+        total = len(frame_paths)
+        batches = queue.Queue(maxsize=self.PREFETCH_BATCHES)
+        stop = threading.Event()
+        io_pool = self._get_io_pool()
+        
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def producer():
+            last_img = None
+            for start in range(0, total, self.batch_size):
+                end = min(start + self.batch_size, total)
+                pair_end = min(end, total - 1)
+                imgs = None
+                if read_images and pair_end > start:
+                    try:
+                        # 上一批的最后一帧即本批第一帧，无需重复读取
+                        # 一批内的帧在线程池中并行解码
+                        first = start if last_img is None else start + 1
+                        decoded = list(io_pool.map(_load_rgb, frame_paths[first:pair_end + 1]))
+                        imgs = decoded if last_img is None else [last_img] + decoded
+                        last_img = imgs[-1]
+                    except Exception as e:
+                        last_img = None
+                        imgs = e
+                if not put((start, end, imgs)):
+                    return
+            put(None)
+        
+        threading.Thread(target=producer, name="rife-prefetch", daemon=True).start()
+        try:
+            while True:
+                item = batches.get()
+                if item is None:
+                    return
+                yield item
+        finally:
+            # 消费方提前退出（如取消）时通知预读线程结束
+            stop.set()
+    
+    def _get_io_pool(self) -> ThreadPoolExecutor:
+        """获取帧读取/写出线程池（首次使用时创建，之后复用）"""
+        if self._io_pool is None:
+            self._io_pool = ThreadPoolExecutor(
+                max_workers=min(8, os.cpu_count() or 1),
+                thread_name_prefix="rife-io"
+            )
+        return self._io_pool
     
     def interpolate_video(
         self,
@@ -248,25 +613,29 @@ class RIFEEngine:
         output_dir: str,
         source_fps: float,
         target_fps: Optional[float] = None,
-        progress_callback: Optional[Callable[[int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        frame_writer: Optional[Callable[[np.ndarray], None]] = None
     ) -> Tuple[int, float]:
         """
         对视频帧序列进行补帧
         
         Args:
             input_dir: 输入帧目录
-            output_dir: 输出帧目录
+            output_dir: 输出帧目录（指定 frame_writer 时不使用）
             source_fps: 原始帧率
             target_fps: 目标帧率
             progress_callback: 进度回调
+            frame_writer: 按输出顺序接收帧 (HWC RGB uint8) 的写入函数，
+                如 VideoEngine.open_frame_writer().write；指定时不写 PNG 中间文件
             
         Returns:
             (输出帧数, 实际目标帧率)
         """
-        os.makedirs(output_dir, exist_ok=True)
+        if frame_writer is None:
+            os.makedirs(output_dir, exist_ok=True)
         
         # 获取所有输入帧
-        input_frames = sorted(Path(input_dir).glob("*.png"))
+        input_frames = _list_png(input_dir)
         if not input_frames:
             logger.error(f"No frames found in {input_dir}")
             return 0, source_fps
@@ -281,49 +650,210 @@ class RIFEEngine:
             f"({total_input} input frames, ~{total_input * (interp_count + 1)} output frames)"
         )
         
-        output_idx = 0
+        copies = interp_count + 1
+        timesteps = tuple((j + 1) / copies for j in range(interp_count))
+        # 路径前缀只拼接一次，循环内仅做字符串格式化
+        input_prefix = os.path.join(input_dir, "")
+        output_prefix = os.path.join(output_dir, "frame_")
+        frame_paths = [f"{input_prefix}{name}" for name in input_frames]
         
-        # 处理每对连续帧
-        for i in range(total_input):
-            # 复制原帧
-            import shutil
-            shutil.copy(input_frames[i], os.path.join(output_dir, f"frame_{output_idx:08d}.png"))
-            output_idx += 1
-            
-            # 如果不是最后一帧，进行插值
-            if i < total_input - 1 and interp_count > 0:
+        def out_path(idx: int) -> str:
+            return f"{output_prefix}{idx:08d}.png"
+        
+        writer = self._get_io_pool()
+        pending = []
+        
+        def link_originals(first: int, last: int):
+            # 插值失败时链接原帧作为fallback（保持输出序号不变）
+            for i in range(first, last):
+                for j in range(interp_count):
+                    _link_or_copy(frame_paths[i], out_path(i * copies + 1 + j))
+        
+        def finish(first: int, last: int, imgs: List[np.ndarray], fetch):
+            nonlocal pending
+            results = None
+            if fetch is not None:
                 try:
-                    # 读取两帧
-                    img0 = np.array(Image.open(input_frames[i]))
-                    img1 = np.array(Image.open(input_frames[i + 1]))
-                    
-                    # 插值
+                    results = fetch()
+                except Exception as e:
+                    logger.error(f"Failed to interpolate frames {first}-{last}: {e}")
+            
+            if frame_writer is not None:
+                # 按输出顺序写入：原帧后接其插值帧，插值失败时重复原帧
+                for k in range(last - first):
+                    frame_writer(imgs[k])
                     for j in range(interp_count):
-                        timestep = (j + 1) / (interp_count + 1)
-                        interp_frame = self.interpolate_frame_pair(img0, img1, timestep)
-                        
-                        if interp_frame is not None:
-                            output_path = os.path.join(output_dir, f"frame_{output_idx:08d}.png")
-                            Image.fromarray(interp_frame).save(output_path)
-                            output_idx += 1
+                        frame_writer(imgs[k] if results is None else results[k * interp_count + j])
+                return
+            
+            if results is None:
+                link_originals(first, last)
+                return
+            
+            # 等待上一批写出完成，限制内存中积压的帧数
+            _wait_writes(pending)
+            pending = [
+                writer.submit(
+                    _save_png, frame,
+                    out_path((first + k // interp_count) * copies + 1 + k % interp_count)
+                )
+                for k, frame in enumerate(results)
+            ]
+        
+        # 每批 batch_size 个帧对：后台预读 batch_size+1 帧，一次推理，写出交给线程池
+        # 已提交、尚未取回结果的上一批 (start, pair_end, imgs, 取结果函数)
+        inflight = None
+        last_img = None
+        batches = self._prefetch_batches(
+            frame_paths, read_images=interp_count > 0 or frame_writer is not None
+        )
+        try:
+            for start, end, imgs in batches:
+                if frame_writer is None:
+                    # 原帧链接到输出目录（输出序号预先确定）
+                    for i in range(start, end):
+                        _link_or_copy(frame_paths[i], out_path(i * copies))
+                
+                pair_end = min(end, total_input - 1)
+                if imgs is not None:
+                    if isinstance(imgs, Exception) and frame_writer is not None:
+                        # 直接编码时原帧也读不到，无法保持输出完整
+                        raise imgs
                     
-                    # 每10帧清理一次显存
-                    if (i + 1) % 10 == 0 and self.device == "cuda":
-                        import torch
-                        torch.cuda.empty_cache()
+                    fetch = None
+                    try:
+                        if isinstance(imgs, Exception):
+                            raise imgs
                         
-                except Exception as e:
-                    logger.error(f"Failed to interpolate frame {i}: {e}")
-                    # 继续处理，复制原帧作为fallback
-                    shutil.copy(input_frames[i], os.path.join(output_dir, f"frame_{output_idx:08d}.png"))
-                    output_idx += 1
+                        if interp_count > 0:
+                            fetch = self.interpolate_batch_async(imgs, timesteps)
+                    
+                    except Exception as e:
+                        logger.error(f"Failed to interpolate frames {start}-{pair_end}: {e}")
+                        # 继续处理
+                        if frame_writer is None:
+                            link_originals(start, pair_end)
+                    
+                    # 本批已提交后再取回上一批：上一批结果拷回与本批推理重叠
+                    if inflight is not None:
+                        finish(*inflight)
+                    inflight = None
+                    if fetch is not None or frame_writer is not None:
+                        inflight = (start, pair_end, imgs, fetch)
+                        last_img = imgs[-1]
+                
+                # 进度日志按批输出，不逐帧记录
+                if end // PROGRESS_LOG_EVERY != start // PROGRESS_LOG_EVERY:
+                    logger.info("Interpolated %d/%d input frames", end, total_input)
+                
+                if progress_callback:
+                    progress_callback(end, total_input)
             
-            if progress_callback:
-                progress_callback(i + 1, total_input)
+            if inflight is not None:
+                finish(*inflight)
+            
+            if frame_writer is not None:
+                # 最后一帧不构成帧对，单独写入
+                frame_writer(last_img if last_img is not None else _load_rgb(frame_paths[-1]))
+        finally:
+            batches.close()
         
+        _wait_writes(pending)
+        
+        output_idx = (total_input - 1) * copies + 1
         logger.info(f"Interpolation complete: {output_idx} frames generated")
         return output_idx, actual_target_fps
     
+    def interpolate_stream(
+        self,
+        frames: Iterable[np.ndarray],
+        frame_writer: Callable[[np.ndarray], None],
+        source_fps: float,
+        target_fps: Optional[float] = None,
+        total: Optional[int] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Tuple[int, float]:
+        """
+        对内存中的帧流补帧（如超分引擎的输出），结果按输出顺序交给 frame_writer，不读写 PNG
+        
+        帧的通道顺序原样保留（RGB/BGR 均可）；每批 batch_size 个帧对一次推理，
+        先提交下一批再取回上一批结果，插值失败时重复原帧，保持输出帧数与时间轴不变
+        
+        Args:
+            frames: 输入帧 (HWC uint8)
+            frame_writer: 输出帧写入函数
+            source_fps: 原始帧率
+            target_fps: 目标帧率
+            total: 输入总帧数（用于进度回调，未知时按已读取帧数）
+            progress_callback: 进度回调 (已读取输入帧数, total)
+            
+        Returns:
+            (输出帧数, 实际目标帧率)
+        """
+        interp_count, actual_target_fps = self.calculate_interpolation_frames(
+            source_fps, target_fps
+        )
+        copies = interp_count + 1
+        timesteps = tuple((j + 1) / copies for j in range(interp_count))
+        
+        count_in = 0
+        count_out = 0
+        
+        def finish(imgs: List[np.ndarray], fetch):
+            # 写出除最后一帧外的原帧及其插值帧（最后一帧是下一批的第一帧）
+            nonlocal count_out
+            results = None
+            if fetch is not None:
+                try:
+                    results = fetch()
+                except Exception as e:
+                    logger.error(f"Failed to interpolate frames {count_out // copies}+: {e}")
+            
+            for k in range(len(imgs) - 1):
+                frame_writer(imgs[k])
+                for j in range(interp_count):
+                    frame_writer(imgs[k] if results is None else results[k * interp_count + j])
+                count_out += copies
+        
+        inflight = None
+        last_img = None
+        it = iter(frames)
+        while True:
+            batch = list(islice(it, self.batch_size))
+            if not batch:
+                break
+            imgs = batch if last_img is None else [last_img] + batch
+            last_img = imgs[-1]
+            count_in += len(batch)
+            
+            fetch = None
+            if len(imgs) > 1 and interp_count > 0:
+                try:
+                    fetch = self.interpolate_batch_async(imgs, timesteps)
+                except Exception as e:
+                    logger.error(f"Failed to interpolate frames {count_in - len(batch)}-{count_in}: {e}")
+            
+            # 本批已提交后再取回上一批：上一批结果拷回与本批推理重叠
+            if inflight is not None:
+                finish(*inflight)
+            inflight = (imgs, fetch) if len(imgs) > 1 else None
+            
+            if count_in // PROGRESS_LOG_EVERY != (count_in - len(batch)) // PROGRESS_LOG_EVERY:
+                logger.info("Interpolated %d input frames", count_in)
+            
+            if progress_callback:
+                progress_callback(count_in, max(total or 0, count_in))
+        
+        if inflight is not None:
+            finish(*inflight)
+        if last_img is not None:
+            # 最后一帧不构成帧对，单独写入
+            frame_writer(last_img)
+            count_out += 1
+        
+        logger.info(f"Interpolation complete: {count_out} frames generated")
+        return count_out, actual_target_fps
+    
     def get_memory_usage(self) -> dict:
         """获取显存使用情况"""
         if self.device != "cuda":
@@ -369,10 +899,7 @@ class SimpleInterpolator:
     ) -> np.ndarray:
         """线性插值两帧"""
         # 简单的线性混合
-        alpha = timestep
-        result = (img0.astype(np.float32) * (1 - alpha) + 
-                  img1.astype(np.float32) * alpha)
-        return result.clip(0, 255).astype(np.uint8)
+        return _blend_frames(img0, img1, timestep)
     
     def is_available(self) -> bool:
         """总是可用"""
@@ -406,6 +933,8 @@ def download_rife_model(output_dir: str = "models/rife") -> bool:
             zip_ref.extractall(output_dir)
         
         os.remove(zip_path)
+        _find_default_model.cache_clear()
+        _find_model_dir.cache_clear()
         logger.info("RIFE model downloaded successfully")
         return True
         
@@ -3,33 +3,130 @@
 基于 Real-ESRGAN + Tile 分块处理
 """
 import os
+import re
 import gc
+import json
+import queue
 import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Optional, Callable, Tuple
+from typing import Optional, Callable, Tuple, Iterable, Iterator, List
+import cv2
 import numpy as np
 from PIL import Image
 
+try:
+    from .performance import (
+        CACHE_DIR, configure_cuda_backends, to_channels_last, compile_module, compile_tensorrt,
+        download_async
+    )
+except ImportError:
+    from performance import (
+        CACHE_DIR, configure_cuda_backends, to_channels_last, compile_module, compile_tensorrt,
+        download_async
+    )
+
 logger = logging.getLogger(__name__)
 
+# upscale_batch 处理的图片扩展名
+IMAGE_EXTENSIONS = frozenset({".png", ".jpg", ".jpeg", ".bmp", ".tiff"})
+
+
+def _iter_batches(items: Iterable, size: int) -> Iterator[list]:
+    """按 size 个一组切分可迭代对象（最后一组可能不足 size）"""
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _gpu_tag() -> str:
+    """当前显卡型号（用作缓存文件名）"""
+    import torch
+    
+    return re.sub(r"[^0-9A-Za-z]+", "-", torch.cuda.get_device_name(0)).strip("-")
+
+
+def _calibration_tiles(frames: Iterable[np.ndarray], side: int, count: int) -> List[np.ndarray]:
+    """从样例帧中按网格切取至多 count 个 side x side 的 tile（用于 INT8 校准）"""
+    tiles = []
+    for frame in frames:
+        h, w = frame.shape[:2]
+        for y in range(0, h - side + 1, side):
+            for x in range(0, w - side + 1, side):
+                tiles.append(np.ascontiguousarray(frame[y:y + side, x:x + side, :3]))
+                if len(tiles) >= count:
+                    return tiles
+    return tiles
+
+
+def _build_network(model_name: str):
+    """
+    按模型名构建网络结构，供 RealESRGANer 加载权重
+    
+    Returns:
+        (网络, 网络原生放大倍数)
+    """
+    if model_name == "RealESRGAN_anime_6B":
+        # 对应权重文件 RealESRGAN_animevideov3.pth
+        from realesrgan.archs.srvgg_arch import SRVGGNetCompact
+        return SRVGGNetCompact(
+            num_in_ch=3, num_out_ch=3, num_feat=64, num_conv=16, upscale=4, act_type="prelu"
+        ), 4
+    
+    from basicsr.archs.rrdbnet_arch import RRDBNet
+    netscale = 2 if model_name == "RealESRGAN_x2plus" else 4
+    return RRDBNet(
+        num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=netscale
+    ), netscale
+
 
 class UpscalerEngine:
     """超分引擎"""
     
     # 预设配置：scale, tile_size, tile_pad
+    # tile 与 config.presets 中的 tile_size 一致（以 config.presets 为准）；
+    # 其 tile_size 为 0 的档位不固定分块，这里的值只在不自动选择 tile 时使用
     PRESETS = {
         "流畅": {"scale": 2, "tile": 512, "pad": 10},   # 720p/1080p
-        "标准": {"scale": 4, "tile": 512, "pad": 10},   # 1080p60
-        "高清": {"scale": 4, "tile": 256, "pad": 10}    # 4K60 (256是平衡选择)
+        "标准": {"scale": 4, "tile": 400, "pad": 10},   # 1080p60
+        "高清": {"scale": 4, "tile": 200, "pad": 10}    # 4K60 (小分块节省显存)
     }
     
+    # 默认每次前向合并的帧数
+    BATCH_FRAMES = 4
+    
+    # INT8 校准使用的 tile 数量
+    CALIBRATION_TILES = 100
+    
+    # 帧流超分时读取/写出队列容量（帧），限制在途帧的内存占用
+    QUEUE_FRAMES = 8
+    
+    # 批量超分图片时解码/编码线程数（cv2 编解码期间释放 GIL）
+    IO_WORKERS = 4
+    
+    # 自动选择 tile 时的候选尺寸（从大到小，取显存放得下的最大者）
+    TILE_CANDIDATES = (1024, 768, 512, 384, 256)
+    
     def __init__(
         self,
         model_path: str = None,
         model_name: str = "RealESRGAN_x4plus",
         preset: str = "标准",
         device: str = "cuda",
-        use_fp16: bool = True
+        use_fp16: bool = True,
+        batch_size: Optional[int] = None,
+        use_tensorrt: bool = False,
+        precision: str = "fp16",
+        calibration_frames: Optional[Iterable[np.ndarray]] = None,
+        auto_tile: bool = True,
+        tile_size: Optional[int] = None,
+        tile_pad: Optional[int] = None
     ):
         """
         Args:
@@ -38,6 +135,17 @@ class UpscalerEngine:
             preset: 预设档位（流畅/标准/高清）
             device: cuda/cpu
             use_fp16: 使用半精度
+            batch_size: 帧流超分时每次前向合并的帧数，默认 BATCH_FRAMES
+            use_tensorrt: 将模型编译为 TensorRT 引擎（需要 torch_tensorrt，仅分块模式；
+                引擎缓存在 ~/.cache/video-upscaler，失败时回退 PyTorch）
+            precision: TensorRT 推理精度 "fp16" / "int8"（int8 隐含 use_tensorrt；
+                出现画质瑕疵时改回 fp16）
+            calibration_frames: INT8 校准用的样例视频帧 (HWC BGR uint8)，
+                已有校准缓存时可省略
+            auto_tile: CUDA 下按显存自动选择最大可用的 tile（结果按显卡与模型缓存），
+                False 时使用预设的 tile
+            tile_size: 指定 tile 边长（0 表示整帧推理），指定时不再自动选择；默认取预设
+            tile_pad: 相邻 tile 的重叠边距（重叠区按余弦窗融合）；默认取预设
         """
         self.model_path = model_path
         self.model_name = model_name
@@ -46,11 +154,24 @@ class UpscalerEngine:
         self.use_fp16 = use_fp16
         
         self.config = self.PRESETS.get(preset, self.PRESETS["标准"])
-        self.tile_size = self.config["tile"]
-        self.tile_pad = self.config["pad"]
+        self.tile_size = self.config["tile"] if tile_size is None else tile_size
+        self.tile_pad = self.config["pad"] if tile_pad is None else tile_pad
         self.scale = self.config["scale"]
+        self.batch_size = max(1, batch_size or self.BATCH_FRAMES)
+        self.precision = precision
+        self.use_tensorrt = use_tensorrt or precision == "int8"
+        self.calibration_frames = calibration_frames
+        self.auto_tile = auto_tile and tile_size is None
         
         self.model = None
+        self.netscale = self.scale
+        # 批量超分的页锁定上传缓冲与拷贝流（首次使用时创建）
+        self._staging = None
+        self._upload_stream = None
+        self._upload_event = None
+        self._download_stream = None
+        # 分块重叠融合的窗口与归一化权重，按块形状缓存
+        self._blend_cache = {}
         self._load_model()
     
     def _load_model(self):
@@ -59,18 +180,25 @@ class UpscalerEngine:
             import torch
             from realesrgan import RealESRGANer
             
+            if self.device == "cuda":
+                # 在加载阶段创建 CUDA 上下文，不推迟到首帧推理
+                torch.cuda.init()
+            
             # 确定模型路径
             if self.model_path and os.path.exists(self.model_path):
                 model_path = self.model_path
             else:
                 # 使用默认模型搜索
                 model_path = self._find_model()
+            self._weights_path = model_path
             
-            # 初始化 Real-ESRGAN
+            # 初始化 Real-ESRGAN：分块切分与拼接由 RealESRGANer 内部完成（tile/tile_pad），
+            # scale 必须是网络原生倍数，预设倍数不同时由 enhance 的 outscale 缩放到目标尺寸
+            network, self.netscale = _build_network(self.model_name)
             self.model = RealESRGANer(
-                scale=self.scale,
+                scale=self.netscale,
                 model_path=model_path,
-                model=self.model_name,
+                model=network,
                 tile=self.tile_size,
                 tile_pad=self.tile_pad,
                 pre_pad=0,
@@ -78,11 +206,161 @@ class UpscalerEngine:
                 device=self.device
             )
             
+            if self.device == "cuda":
+                configure_cuda_backends()
+                # 权重为 channels_last 时卷积按 NHWC 内核执行（CPU 上无收益，跳过）
+                self.model.model = to_channels_last(self.model.model)
+                if self.auto_tile:
+                    self._autotune_tile_size()
+                trt_module = self._build_trt_engine() if self.use_tensorrt else None
+                if trt_module is not None:
+                    self.model.model = trt_module
+                else:
+                    # 分块推理的 tile 形状固定，按形状特化编译
+                    self.model.model = compile_module(self.model.model, dynamic=False)
+                self._warmup(self.tile_size)
+            
         except ImportError:
             raise RuntimeError("realesrgan not installed. Run: pip install realesrgan")
         except Exception as e:
             raise RuntimeError(f"Failed to load model: {e}")
     
+    def _autotune_tile_size(self):
+        """
+        选择显存放得下的最大 tile（tile 越大拼接越少、重叠浪费越少、GPU 利用率越高）
+        
+        从 TILE_CANDIDATES 由大到小各用全零输入试一次 batch_size 个 tile 的前向，
+        第一个不 OOM 的即为结果；结果缓存为
+        ~/.cache/video-upscaler/tile_{gpu}_{weights}_b{batch}_p{pad}_{fp16|fp32}.json，
+        之后直接读取。须在编译（torch.compile/TensorRT）之前调用
+        """
+        import torch
+        
+        precision = "fp16" if self.model.half else "fp32"
+        weights = Path(self._weights_path).stem
+        cache_path = CACHE_DIR / f"tile_{_gpu_tag()}_{weights}_b{self.batch_size}_p{self.tile_pad}_{precision}.json"
+        
+        tile = None
+        try:
+            tile = int(json.loads(cache_path.read_text())["tile_size"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        
+        if tile is None:
+            net = self.model.model
+            dtype = torch.float16 if self.model.half else torch.float32
+            for candidate in self.TILE_CANDIDATES:
+                side = candidate + 2 * self.tile_pad
+                try:
+                    with torch.inference_mode():
+                        x = torch.zeros((self.batch_size, 3, side, side), dtype=dtype, device=self.model.device)
+                        net(x.contiguous(memory_format=torch.channels_last))
+                    torch.cuda.synchronize()
+                    tile = candidate
+                    break
+                except RuntimeError as e:
+                    if "out of memory" not in str(e):
+                        logger.warning(f"Tile autotune failed, keeping preset tile: {e}")
+                        return
+                    # 释放 OOM 时残留的缓存块后再试更小的 tile
+                    x = None
+                    torch.cuda.empty_cache()
+            if tile is None:
+                return
+            try:
+                CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                cache_path.write_text(json.dumps({"tile_size": tile}))
+            except OSError as e:
+                logger.debug(f"Failed to cache tile size: {e}")
+        
+        logger.info(f"Auto tile size: {tile} (preset {self.config['tile']})")
+        self.tile_size = tile
+        self.model.tile = tile
+    
+    def _build_trt_engine(self):
+        """
+        将网络编译为 TensorRT 引擎，缓存为 ~/.cache/video-upscaler/trt_{gpu}_{tile}_b{batch}_{model}_{fp16|fp32}.ts
+        
+        每个 tile 输入最大为 tile + 2*pad 见方（边缘 tile 更小，按动态形状处理），
+        不分块或编译失败时返回 None
+        """
+        import torch
+        
+        if not self.tile_size:
+            logger.info("TensorRT requires tiled inference, skipped")
+            return None
+        
+        side = self.tile_size + 2 * self.tile_pad
+        gpu = _gpu_tag()
+        dtype = torch.half if self.use_fp16 else torch.float
+        precisions = {dtype}
+        calibrator = None
+        dtype_tag = "fp16" if self.use_fp16 else "fp32"
+        cache_path = CACHE_DIR / f"trt_{gpu}_{side}_b{self.batch_size}_{self.model_name}_{dtype_tag}.ts"
+        if self.precision == "int8":
+            int8_path = cache_path.with_name(cache_path.stem + "_int8.ts")
+            # 已有 INT8 引擎缓存时直接加载，无需校准
+            calibrator = None if int8_path.exists() else self._build_int8_calibrator(side, dtype)
+            if int8_path.exists() or calibrator is not None:
+                precisions.add(torch.int8)
+                cache_path = int8_path
+        
+        try:
+            return compile_tensorrt(
+                self.model.model,
+                min_shape=(1, 3, 2, 2),
+                opt_shape=(self.batch_size, 3, side, side),
+                max_shape=(self.batch_size, 3, side, side),
+                cache_path=cache_path,
+                dtype=dtype,
+                enabled_precisions=precisions,
+                calibrator=calibrator
+            )
+        except ImportError:
+            logger.warning("torch_tensorrt not installed, using PyTorch inference")
+        except Exception as e:
+            logger.warning(f"TensorRT build failed, using PyTorch inference: {e}")
+        return None
+    
+    def _build_int8_calibrator(self, side: int, dtype):
+        """
+        构建 INT8 训练后量化 (PTQ) 校准器：从样例帧中切取 CALIBRATION_TILES 个 tile，
+        校准结果缓存为 ~/.cache/video-upscaler/calib_{model}_{side}.cache，之后无需样例帧
+        
+        既无缓存也无样例帧时返回 None（回退 FP16 引擎）
+        """
+        import torch
+        
+        try:
+            import torch_tensorrt
+        except ImportError:
+            return None
+        
+        cache_file = CACHE_DIR / f"calib_{self.model_name}_{side}.cache"
+        use_cache = cache_file.exists()
+        tiles = []
+        if not use_cache and self.calibration_frames is not None:
+            tiles = _calibration_tiles(self.calibration_frames, side, self.CALIBRATION_TILES)
+        if not use_cache and not tiles:
+            logger.warning("INT8 requires calibration frames, using FP16 engine")
+            return None
+        
+        if tiles:
+            data = torch.from_numpy(np.stack(tiles)).permute(0, 3, 1, 2).flip(1).to(dtype).div_(255.0)
+        else:
+            # 仅读取校准缓存，不再前向
+            data = torch.zeros((1, 3, side, side), dtype=dtype)
+        loader = torch.utils.data.DataLoader(torch.utils.data.TensorDataset(data), batch_size=1)
+        
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        return torch_tensorrt.ptq.DataLoaderCalibrator(
+            loader,
+            cache_file=str(cache_file),
+            use_cache=use_cache,
+            algo_type=torch_tensorrt.ptq.CalibrationAlgo.ENTROPY_CALIBRATION_2,
+            device=torch.device("cuda:0")
+        )
+    
     def _find_model(self) -> str:
         """查找模型文件"""
         # 常见位置
@@ -115,7 +393,8 @@ class UpscalerEngine:
         self,
         image_path: str,
         output_path: str,
-        progress_callback: Optional[Callable[[int], None]] = None
+        progress_callback: Optional[Callable[[int], None]] = None,
+        alpha: bool = True
     ) -> str:
         """
         超分单张图片
@@ -124,86 +403,655 @@ class UpscalerEngine:
             image_path: 输入图片路径
             output_path: 输出图片路径
             progress_callback: 进度回调 (0-100)
+            alpha: 保留透明通道；False 时按 3 通道读取（视频帧无透明度），
+                True 时完全不透明的 alpha 也会丢弃，避免 RealESRGANer 对 alpha 再推理一次
         
         Returns:
             输出文件路径
         """
-        import cv2
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        
+        # JPEG 输入在显卡上解码（nvJPEG），解码结果直接用于推理
+        if self._upscale_jpeg_gpu(image_path, output_path):
+            return output_path
         
         # 读取图片
-        img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED)
-        if img is None:
-            raise ValueError(f"Failed to load image: {image_path}")
+        img = self._read_image(image_path, alpha)
         
         # 超分
-        try:
-            output, _ = self.model.enhance(img, outscale=self.scale)
-        except RuntimeError as e:
-            if "out of memory" in str(e):
-                # 显存不足，减小 tile 重试
-                self._reduce_tile_size()
-                output, _ = self.model.enhance(img, outscale=self.scale)
-            else:
-                raise
+        output = self._enhance(img)
         
         # 保存
-        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
-        cv2.imwrite(output_path, output)
+        self._write_image(output_path, output)
         
         return output_path
     
+    @staticmethod
+    def _read_image(image_path: str, alpha: bool = True) -> np.ndarray:
+        """读取图片（完全不透明的 alpha 通道直接丢弃，见 upscale_image）"""
+        img = cv2.imread(image_path, cv2.IMREAD_UNCHANGED if alpha else cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"Failed to load image: {image_path}")
+        if img.ndim == 3 and img.shape[2] == 4 and img[:, :, 3].min() == np.iinfo(img.dtype).max:
+            img = img[:, :, :3]
+        return img
+    
+    @staticmethod
+    def _write_image(output_path: str, img: np.ndarray):
+        """保存图片（cv2.imwrite 失败时抛出异常）"""
+        if not cv2.imwrite(output_path, img):
+            raise IOError(f"Failed to write image: {output_path}")
+    
+    def _decodes_on_gpu(self, image_path: str) -> bool:
+        """该图片是否走显卡 JPEG 解码（见 _upscale_jpeg_gpu）"""
+        return (
+            self.device == "cuda"
+            and os.path.splitext(image_path)[1].lower() in (".jpg", ".jpeg")
+        )
+    
+    def _upscale_jpeg_gpu(self, image_path: str, output_path: str) -> bool:
+        """
+        用 torchvision 的 nvJPEG 解码/编码在显卡上处理 JPEG（不经 CPU 解码与原始像素上传）
+        
+        仅 CUDA 下的 .jpg/.jpeg 输入；输出为 JPEG 时同样在显卡上编码，
+        其他格式拷回后由 OpenCV 保存。不支持（如 torchvision 版本过旧）时返回 False
+        """
+        if self.model is None or not self._decodes_on_gpu(image_path):
+            return False
+        
+        try:
+            import torch
+            import torch.nn.functional as F
+            from torchvision.io import ImageReadMode, decode_jpeg, encode_jpeg, read_file, write_file
+            
+            with torch.inference_mode():
+                img = decode_jpeg(read_file(image_path), mode=ImageReadMode.RGB, device="cuda")
+                out = self._infer_rgb(img.unsqueeze(0))
+                
+                if self.scale != self.netscale:
+                    h, w = img.shape[1:]
+                    size = (int(h * self.scale), int(w * self.scale))
+                    out = F.interpolate(out.float(), size=size, mode="bicubic", antialias=True)
+                    out = out.round_().clamp_(0, 255).to(torch.uint8)
+                out = out[0]
+                
+                if os.path.splitext(output_path)[1].lower() in (".jpg", ".jpeg"):
+                    write_file(output_path, encode_jpeg(out, quality=95).cpu())
+                else:
+                    output = out.flip(0).permute(1, 2, 0).contiguous().cpu().numpy()
+                    cv2.imwrite(output_path, output)
+            return True
+        except Exception as e:
+            logger.debug(f"GPU JPEG path unavailable, using OpenCV: {e}")
+            return False
+    
     def upscale_batch(
         self,
         input_dir: str,
         output_dir: str,
-        progress_callback: Optional[Callable[[int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        alpha: bool = True
     ) -> Tuple[int, int]:
         """
         批量超分图片
         
+        图片在线程池中预读解码、结果在线程池中编码保存（各自最多 QUEUE_FRAMES 张在途），
+        超分在当前线程中进行，GPU 不等待 PNG 编解码；尺寸一致的连续图片（如视频帧）
+        每 batch_size 张合并为一次前向，批量失败时逐张处理
+        
         Args:
             input_dir: 输入目录
             output_dir: 输出目录
             progress_callback: 进度回调 (current, total)
+            alpha: 保留透明通道（见 upscale_image；视频帧传 False）
         
         Returns:
             (成功数, 总数)
         """
-        # 获取所有图片
-        image_files = []
-        for ext in (".png", ".jpg", ".jpeg", ".bmp", ".tiff"):
-            image_files.extend(Path(input_dir).glob(f"*{ext}"))
-        
-        image_files = sorted(image_files)
+        # 获取所有图片（单次扫描目录，扩展名不区分大小写）
+        image_files = sorted(
+            Path(entry.path) for entry in os.scandir(input_dir)
+            if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS
+        )
         total = len(image_files)
         success = 0
         
         os.makedirs(output_dir, exist_ok=True)
         
-        for i, img_path in enumerate(image_files):
-            output_path = os.path.join(output_dir, img_path.name)
+        def load(path: Path) -> Optional[np.ndarray]:
+            # 显卡解码的 JPEG 由 upscale_image 直接读取
+            return None if self._decodes_on_gpu(str(path)) else self._read_image(str(path), alpha)
+        
+        reads = deque()
+        writes = deque()
+        
+        def finish_write() -> bool:
+            path, future = writes.popleft()
             try:
-                self.upscale_image(str(img_path), output_path)
-                success += 1
+                future.result()
+                return True
             except Exception as e:
-                logger.error(f"Failed to upscale {img_path}: {e}")
+                logger.error(f"Failed to upscale {path}: {e}")
+                return False
+        
+        pending = iter(image_files)
+        with ThreadPoolExecutor(max_workers=self.IO_WORKERS, thread_name_prefix="upscale-io") as pool:
+            for path in islice(pending, self.QUEUE_FRAMES):
+                reads.append((path, pool.submit(load, path)))
+            
+            done = 0
+            while reads:
+                loaded = []
+                n = min(self.batch_size, len(reads))
+                for _ in range(n):
+                    img_path, future = reads.popleft()
+                    next_path = next(pending, None)
+                    if next_path is not None:
+                        reads.append((next_path, pool.submit(load, next_path)))
+                    
+                    output_path = os.path.join(output_dir, img_path.name)
+                    try:
+                        img = future.result()
+                        if img is None:
+                            self.upscale_image(str(img_path), output_path, alpha=alpha)
+                            success += 1
+                        else:
+                            loaded.append((img_path, output_path, img))
+                    except Exception as e:
+                        logger.error(f"Failed to upscale {img_path}: {e}")
                 
-            # 每10帧清理一次显存，平衡速度和内存
-            if (i + 1) % 10 == 0 and self.device == "cuda":
-                import torch
-                torch.cuda.empty_cache()
+                outputs = None
+                imgs = [img for _, _, img in loaded]
+                if len(imgs) > 1 and self._can_batch(imgs):
+                    try:
+                        outputs = self._enhance_batch(imgs)
+                    except Exception as e:
+                        logger.warning(f"Batched upscale failed, falling back to per-image: {e}")
+                
+                for k, (img_path, output_path, img) in enumerate(loaded):
+                    try:
+                        output = outputs[k] if outputs is not None else self._enhance(img)
+                        writes.append((img_path, pool.submit(self._write_image, output_path, output)))
+                    except Exception as e:
+                        logger.error(f"Failed to upscale {img_path}: {e}")
+                
+                while len(writes) > self.QUEUE_FRAMES:
+                    success += finish_write()
+                
+                done += n
+                if progress_callback:
+                    progress_callback(done, total)
             
-            if progress_callback:
-                progress_callback(i + 1, total)
+            while writes:
+                success += finish_write()
         
         return success, total
     
+    def upscale_frames(
+        self,
+        frames: Iterable[np.ndarray],
+        frame_writer: Callable[[np.ndarray], None],
+        total: Optional[int] = None,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        dedup_threshold: float = 0.0
+    ) -> Tuple[int, int]:
+        """
+        超分内存中的帧流（如 VideoEngine.open_frame_reader 的输出），结果按顺序交给 frame_writer
+        
+        不经过 PNG 中间文件；每 batch_size 帧合并为一次前向，
+        单帧失败时写入插值放大的原帧，保持帧数与时间轴不变
+        
+        读取（解码）与写出（编码）各在一个后台线程中进行，经有界队列与推理重叠，
+        GPU 不必等待 IO
+        
+        Args:
+            frames: 输入帧 (HWC BGR uint8)
+            frame_writer: 输出帧写入函数
+            total: 总帧数（用于进度回调，未知时按已处理帧数）
+            progress_callback: 进度回调 (current, total)
+            dedup_threshold: 重复帧阈值；帧缩小到 32x32 后与上一个超分帧的平均绝对差
+                低于该值时直接复用上一个输出，不再推理（0 表示不启用）
+        
+        Returns:
+            (成功数, 总数)
+        """
+        success = 0
+        count = 0
+        last_output = None
+        source = self._prefetch_frames(frames)
+        put, close_writer = self._write_behind(frame_writer)
+        is_duplicate = self._duplicate_detector(dedup_threshold)
+        
+        def finish(batch: List[np.ndarray], dups: List[bool], fetch):
+            """取回一批结果（批量失败时逐帧处理）并按顺序写出，重复帧复用上一个输出"""
+            nonlocal success, count, last_output
+            outputs = None
+            if fetch is not None:
+                try:
+                    outputs = fetch()
+                    success += len(batch)
+                except Exception as e:
+                    logger.warning(f"Batched upscale failed, falling back to per-frame: {e}")
+            
+            if outputs is None:
+                outputs = []
+                for k, img in enumerate(batch):
+                    output, ok = self._upscale_or_resize(img, count + k + 1)
+                    outputs.append(output)
+                    success += ok
+            
+            outputs = iter(outputs)
+            for dup in dups:
+                if dup:
+                    success += 1
+                else:
+                    last_output = next(outputs)
+                count += 1
+                put(last_output)
+                
+                if progress_callback:
+                    progress_callback(count, max(total or 0, count))
+        
+        # 先提交下一批再取回上一批：上一批的拷回与下一批的推理重叠
+        inflight = None
+        try:
+            for frames_in in _iter_batches(source, self.batch_size):
+                dups = [is_duplicate(frame) for frame in frames_in]
+                batch = [frame for frame, dup in zip(frames_in, dups) if not dup]
+                fetch = None
+                if batch and self._can_batch(batch):
+                    try:
+                        fetch = self._enhance_batch_async(batch)
+                    except Exception as e:
+                        logger.warning(f"Batched upscale failed, falling back to per-frame: {e}")
+                
+                if inflight is not None:
+                    finish(*inflight)
+                inflight = (batch, dups, fetch)
+            
+            if inflight is not None:
+                finish(*inflight)
+        except BaseException:
+            close_writer(False)
+            raise
+        finally:
+            source.close()
+        close_writer(True)
+        
+        return success, count
+    
+    def _prefetch_frames(self, frames: Iterable[np.ndarray]) -> Iterator[np.ndarray]:
+        """后台线程预读帧（FFmpeg 解码与推理重叠），读取异常在消费方重新抛出"""
+        items = queue.Queue(maxsize=self.QUEUE_FRAMES)
+        stop = threading.Event()
+        
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def producer():
+            it = iter(frames)
+            try:
+                for frame in it:
+                    if not put((frame, None)):
+                        return
+                put((None, None))
+            except Exception as e:
+                put((None, e))
+            finally:
+                # 提前结束时关闭读取器（结束 FFmpeg 进程）
+                close = getattr(it, "close", None)
+                if close is not None:
+                    close()
+        
+        threading.Thread(target=producer, name="upscale-prefetch", daemon=True).start()
+        try:
+            while True:
+                frame, error = items.get()
+                if error is not None:
+                    raise error
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            # 消费方提前退出（如取消）时通知预读线程结束
+            stop.set()
+    
+    def _write_behind(
+        self,
+        frame_writer: Callable[[np.ndarray], None]
+    ) -> Tuple[Callable[[np.ndarray], None], Callable[[bool], None]]:
+        """
+        后台线程写出帧（编码管道写入与推理重叠）
+        
+        返回 (put, finish)：put 将帧放入有界队列（写出出错时抛出该异常）；
+        finish(True) 等待写完并抛出写出异常，finish(False) 丢弃未写出的帧
+        """
+        items = queue.Queue(maxsize=self.QUEUE_FRAMES)
+        errors = []
+        dropped = threading.Event()
+        done = object()
+        
+        def consumer():
+            while True:
+                item = items.get()
+                if item is done:
+                    return
+                if errors or dropped.is_set():
+                    continue
+                try:
+                    frame_writer(item)
+                except Exception as e:
+                    errors.append(e)
+        
+        thread = threading.Thread(target=consumer, name="upscale-writer", daemon=True)
+        thread.start()
+        
+        def put(frame: np.ndarray):
+            if errors:
+                raise errors[0]
+            items.put(frame)
+        
+        def finish(wait: bool):
+            if not wait:
+                dropped.set()
+            items.put(done)
+            thread.join()
+            if wait and errors:
+                raise errors[0]
+        
+        return put, finish
+    
+    @staticmethod
+    def _duplicate_detector(threshold: float) -> Callable[[np.ndarray], bool]:
+        """
+        返回重复帧判断函数：帧缩小到 32x32 后与上一个非重复帧比较平均绝对差，
+        低于 threshold 时视为重复（threshold <= 0 时始终返回 False）
+        """
+        if threshold <= 0:
+            return lambda frame: False
+        
+        reference = None
+        
+        def is_duplicate(frame: np.ndarray) -> bool:
+            nonlocal reference
+            thumb = cv2.resize(frame, (32, 32), interpolation=cv2.INTER_AREA).astype(np.int16)
+            if (
+                reference is not None
+                and thumb.shape == reference.shape
+                and np.abs(thumb - reference).mean() < threshold
+            ):
+                return True
+            reference = thumb
+            return False
+        
+        return is_duplicate
+    
+    def _upscale_or_resize(self, img: np.ndarray, index: int) -> Tuple[np.ndarray, bool]:
+        """超分单帧；失败时返回插值放大的原帧"""
+        try:
+            return self._enhance(img), True
+        except Exception as e:
+            logger.error(f"Failed to upscale frame {index}: {e}")
+            h, w = img.shape[:2]
+            output = cv2.resize(
+                img, (int(w * self.scale), int(h * self.scale)),
+                interpolation=cv2.INTER_CUBIC
+            )
+            return output, False
+    
+    def _can_batch(self, imgs: List[np.ndarray]) -> bool:
+        """帧尺寸一致的 3 通道 uint8 帧才能合并为一个 batch（带 alpha 等情况走 enhance）"""
+        first = imgs[0]
+        return (
+            self.model is not None
+            and first.dtype == np.uint8
+            and first.ndim == 3 and first.shape[2] == 3
+            and all(img.shape == first.shape and img.dtype == np.uint8 for img in imgs)
+        )
+    
+    def _enhance_batch(self, imgs: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        多帧合并为一次前向超分 (HWC BGR uint8)，结果与 RealESRGANer.enhance 一致
+        
+        RealESRGANer.enhance 每次只处理一帧；这里直接调用网络，
+        分块时所有帧的所有 tile 一起组成 batch 前向（见 _forward_tiled）
+        """
+        return self._enhance_batch_async(imgs)()
+    
+    def _enhance_batch_async(self, imgs: List[np.ndarray]) -> Callable[[], List[np.ndarray]]:
+        """
+        提交一批超分，立即返回取结果的函数（参数与结果同 _enhance_batch）
+        
+        CUDA 下上传、推理与拷回都只在流上排队：调用方先提交下一批再取回本批结果，
+        拷贝即与推理重叠
+        """
+        import torch
+        
+        h, w = imgs[0].shape[:2]
+        
+        with torch.inference_mode():
+            # uint8 上传，BGR->RGB 与维度变换在设备上完成
+            batch = self._upload(imgs)
+            out = self._infer_rgb(batch.permute(0, 3, 1, 2).flip(1))
+            fetch = self._download_async(out.flip(1).permute(0, 2, 3, 1).contiguous())
+        
+        if self.scale == self.netscale:
+            return fetch
+        size = (int(w * self.scale), int(h * self.scale))
+        return lambda: [cv2.resize(img, size, interpolation=cv2.INTER_LANCZOS4) for img in fetch()]
+    
+    def _infer_rgb(self, batch: 'torch.Tensor') -> 'torch.Tensor':
+        """
+        超分设备上的 NCHW RGB uint8 帧，返回网络原生倍数的 NCHW RGB uint8 结果
+        
+        需在 inference_mode 下调用
+        """
+        import torch
+        import torch.nn.functional as F
+        
+        h, w = batch.shape[2:]
+        dtype = torch.float16 if self.model.half else torch.float32
+        
+        x = batch.to(dtype).div_(255.0)
+        if self.device == "cuda":
+            # 与 channels_last 权重一致，卷积直接走 NHWC 张量核心内核，无需逐层转换布局
+            x = x.contiguous(memory_format=torch.channels_last)
+        
+        # x2 网络内部做 pixel_unshuffle，输入边长需为偶数（同 RealESRGANer.pre_process）
+        mod_pad_h = h % 2 if self.netscale == 2 else 0
+        mod_pad_w = w % 2 if self.netscale == 2 else 0
+        if mod_pad_h or mod_pad_w:
+            x = F.pad(x, (0, mod_pad_w, 0, mod_pad_h), "reflect")
+        
+        out = self._forward_tiled(x)
+        out = out[:, :, :h * self.netscale, :w * self.netscale]
+        
+        return out.clamp_(0, 1).mul_(255.0).round_().to(torch.uint8)
+    
+    def _upload(self, imgs: List[np.ndarray]) -> 'torch.Tensor':
+        """
+        将一批帧 (HWC uint8) 上传到设备，返回 NHWC uint8 张量
+        
+        CUDA 下帧直接堆叠进预分配的页锁定缓冲，在上传流上异步拷贝，
+        计算流只等待拷贝完成，不阻塞主机
+        """
+        import torch
+        
+        if self.device != "cuda":
+            return torch.from_numpy(np.stack(imgs))
+        
+        if self._upload_stream is None:
+            self._upload_stream = torch.cuda.Stream()
+        # 上一批拷贝完成后才能覆盖缓冲
+        if self._upload_event is not None:
+            self._upload_event.synchronize()
+        
+        n = len(imgs)
+        shape = imgs[0].shape
+        if self._staging is None or self._staging.shape[1:] != shape or self._staging.shape[0] < n:
+            self._staging = torch.empty((max(n, self.batch_size),) + shape, dtype=torch.uint8, pin_memory=True)
+        staging = self._staging[:n]
+        np.stack(imgs, out=staging.numpy())
+        
+        with torch.cuda.stream(self._upload_stream):
+            batch = staging.to(self.model.device, non_blocking=True)
+            self._upload_event = torch.cuda.Event()
+            self._upload_event.record()
+        torch.cuda.current_stream().wait_stream(self._upload_stream)
+        batch.record_stream(torch.cuda.current_stream())
+        return batch
+    
+    def _download_async(self, frames: 'torch.Tensor') -> Callable[[], List[np.ndarray]]:
+        """将设备上的 NHWC uint8 结果异步拷回主机，返回取结果的函数（见 download_async）"""
+        import torch
+        
+        if frames.is_cuda and self._download_stream is None:
+            self._download_stream = torch.cuda.Stream()
+        return download_async(frames, self._download_stream)
+    
+    def _forward_tiled(self, x: 'torch.Tensor') -> 'torch.Tensor':
+        """
+        对 NCHW 输入前向；tile_size > 0 时分块推理
+        
+        按 tile_size 确定行列块数后把块均分到整帧（块尺寸不超过 tile_size，避免大 tile 时补齐浪费），
+        四周补 tile_pad 的重叠上下文（边缘复制），右/下补齐到块的整数倍，
+        用 unfold 一次切出所有帧的全部块（尺寸统一为 块 + 2*pad），每次 batch_size 个块前向；
+        输出块乘 Hann 窗后由一次 fold 叠加回整帧并按窗口权重归一化，重叠区平滑过渡、无拼接缝
+        """
+        import torch
+        import torch.nn.functional as F
+        
+        net = self.model.model
+        if not self.tile_size:
+            return net(x)
+        
+        n, c, h, w = x.shape
+        s = self.netscale
+        tile, pad = self.tile_size, self.tile_pad
+        ny, nx = -(-h // tile), -(-w // tile)
+        # 块边长取 8 的倍数（且为偶数，满足 x2 网络的 pixel_unshuffle）
+        th = min(tile, (-(-h // ny) + 7) // 8 * 8)
+        tw = min(tile, (-(-w // nx) + 7) // 8 * 8)
+        
+        padded = F.pad(x, (pad, pad + nx * tw - w, pad, pad + ny * th - h), mode="replicate")
+        # (N, C, ny, nx, th+2p, tw+2p) -> (N*ny*nx, C, th+2p, tw+2p)
+        tiles = padded.unfold(2, th + 2 * pad, th).unfold(3, tw + 2 * pad, tw)
+        tiles = tiles.permute(0, 2, 3, 1, 4, 5).reshape(-1, c, th + 2 * pad, tw + 2 * pad)
+        if self.device == "cuda":
+            tiles = tiles.contiguous(memory_format=torch.channels_last)
+        
+        kh, kw = tiles.shape[2] * s, tiles.shape[3] * s
+        out = x.new_empty((tiles.shape[0], c, kh, kw))
+        for i in range(0, tiles.shape[0], self.batch_size):
+            out[i:i + self.batch_size] = net(tiles[i:i + self.batch_size])
+        
+        if not pad:
+            # 无重叠：块直接按网格重排
+            out = out.view(n, ny, nx, c, kh, kw).permute(0, 3, 1, 4, 2, 5)
+            return out.reshape(n, c, ny * kh, nx * kw)[:, :, :h * s, :w * s]
+        
+        # (N*ny*nx, C, kh, kw) -> (N, C*kh*kw, ny*nx)，fold 将各块按步长叠加
+        size = (ny * th * s + 2 * pad * s, nx * tw * s + 2 * pad * s)
+        stride = (th * s, tw * s)
+        window, norm = self._blend_weights(kh, kw, ny, nx, size, stride, out)
+        cols = out.mul_(window).view(n, ny * nx, c * kh * kw).transpose(1, 2)
+        out = F.fold(cols, size, kernel_size=(kh, kw), stride=stride).div_(norm)
+        return out[:, :, pad * s:pad * s + h * s, pad * s:pad * s + w * s]
+    
+    def _blend_weights(self, kh: int, kw: int, ny: int, nx: int, size, stride, like: 'torch.Tensor'):
+        """输出块的 Hann 融合窗口 (kh, kw) 与 fold 叠加后的窗口权重和 (1, 1, H, W)，按形状缓存"""
+        import torch
+        import torch.nn.functional as F
+        
+        key = (kh, kw, ny, nx, like.dtype, like.device)
+        cached = self._blend_cache.get(key)
+        if cached is None:
+            wy = torch.hann_window(kh, periodic=False, dtype=torch.float32, device=like.device)
+            wx = torch.hann_window(kw, periodic=False, dtype=torch.float32, device=like.device)
+            # 窗口边缘为 0，下限避免半精度下帧角权重下溢（只有单块覆盖的位置归一化后不受影响）
+            window = (wy[:, None] * wx[None, :]).clamp_min_(1e-3)
+            cols = window.reshape(1, kh * kw, 1).expand(1, kh * kw, ny * nx)
+            norm = F.fold(cols, size, kernel_size=(kh, kw), stride=stride)
+            cached = (window.to(like.dtype), norm.to(like.dtype))
+            self._blend_cache[key] = cached
+        return cached
+    
+    def warmup(self, width: int, height: int):
+        """
+        用一帧空白图像预热（处理开始前调用一次）
+        
+        显存缓存分配器预先申请整帧推理所需的显存块并保留复用（不再周期性 empty_cache），
+        cuDNN 算法选择与 torch.compile 编译的首次开销也在处理开始前完成
+        
+        Args:
+            width: 输入帧宽度
+            height: 输入帧高度
+        """
+        if self.device != "cuda" or self.model is None:
+            return
+        
+        try:
+            blank = np.zeros((height, width, 3), dtype=np.uint8)
+            self._enhance_batch([blank] * self.batch_size)
+        except Exception as e:
+            logger.warning(f"Upscaler warmup failed: {e}")
+    
+    def _enhance(self, img: np.ndarray) -> np.ndarray:
+        """超分一帧 (HWC BGR uint8)，显存不足时减小 tile 重试"""
+        import torch
+        
+        with torch.inference_mode():
+            try:
+                output, _ = self.model.enhance(img, outscale=self.scale)
+            except RuntimeError as e:
+                if "out of memory" in str(e):
+                    # 显存不足：归还失败前按大 tile 申请的缓存块，减小 tile 重试
+                    # （只在此处释放缓存，正常处理中保留复用，不反复向驱动申请）
+                    torch.cuda.empty_cache()
+                    self._reduce_tile_size()
+                    output, _ = self.model.enhance(img, outscale=self.scale)
+                else:
+                    raise
+        return output
+    
     def _reduce_tile_size(self):
         """减小 tile size 以节省显存"""
         if self.tile_size > 64:
             self.tile_size = max(64, self.tile_size // 2)
             self.model.tile = self.tile_size
             logger.warning(f"Reduced tile size to {self.tile_size} due to OOM")
+            self._warmup(self.tile_size)
+    
+    def _warmup(self, tile_size: int, iterations: int = 3):
+        """
+        用全零 tile 前向若干次，cuDNN 按该 tile 形状选好卷积算法并缓存
+        
+        覆盖逐帧 enhance（batch 1）与批量超分（batch_size）两种输入形状；
+        不分块时输入为整帧，由 warmup 按实际帧尺寸预热
+        """
+        if self.device != "cuda" or self.model is None or not tile_size:
+            return
+        
+        import torch
+        
+        side = tile_size + 2 * self.tile_pad
+        dtype = torch.float16 if self.model.half else torch.float32
+        try:
+            with torch.inference_mode():
+                for n in sorted({1, self.batch_size}):
+                    x = torch.zeros((n, 3, side, side), dtype=dtype, device=self.model.device)
+                    x = x.contiguous(memory_format=torch.channels_last)
+                    for _ in range(iterations):
+                        self.model.model(x)
+            torch.cuda.synchronize()
+        except Exception as e:
+            logger.warning(f"Tile warmup failed: {e}")
     
     def get_memory_usage(self) -> dict:
         """获取显存使用情况"""
@@ -6,10 +6,15 @@ import os
 import subprocess
 import tempfile
 import shutil
+import threading
+from collections import deque
 from pathlib import Path
-from typing import Optional, Callable, Tuple
+from functools import lru_cache
+from typing import Optional, Callable, Tuple, Iterator
 import json
 
+import numpy as np
+
 from config.presets import PresetConfig, get_preset_config, PresetLevel
 
 
@@ -113,6 +118,109 @@ class ProcessingOptions:
         return ""
 
 
+# FFmpeg 失败时保留的 stderr 末尾行数
+STDERR_TAIL_LINES = 200
+
+
+def _run_ffmpeg(cmd: list, on_frame: Optional[Callable[[int], None]] = None) -> Tuple[int, str]:
+    """
+    运行 FFmpeg 命令，返回 (返回码, stderr 末尾)
+
+    stderr 在后台线程中逐行读取，只保留最后 STDERR_TAIL_LINES 行，长时间编码不在内存中累积日志；
+    命令带 -progress pipe:1 时逐条解析 stdout 中的 frame=N，回调已处理帧数
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace"
+    )
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    reader = threading.Thread(target=tail.extend, args=(process.stderr,), daemon=True)
+    reader.start()
+
+    for line in process.stdout:
+        key, _, value = line.partition("=")
+        value = value.strip()
+        if on_frame and key == "frame" and value.isdigit():
+            on_frame(int(value))
+
+    returncode = process.wait()
+    reader.join()
+    return returncode, "".join(tail)
+
+
+def _cuda_upload_args(video_args: list) -> list:
+    """
+    NVENC 编码改为从显存读帧：帧转换为 NV12 后经 hwupload_cuda 上传，
+    编码器直接使用 CUDA 帧（不再以 -pix_fmt 指定系统内存像素格式）
+    """
+    args = []
+    skip = False
+    for arg in video_args:
+        if skip:
+            skip = False
+            continue
+        if arg == "-pix_fmt":
+            skip = True
+            continue
+        args.append(arg)
+    return [
+        "-init_hw_device", "cuda=cu:0",
+        "-filter_hw_device", "cu",
+        "-vf", "format=nv12,hwupload_cuda"
+    ] + args
+
+
+def _hwaccel_args(hwaccel: Optional[str]) -> list:
+    """
+    解码输入选项：使用 NVDEC 等硬件解码（帧由 FFmpeg 取回系统内存后再做像素格式转换），
+    省去 CPU 软件解码；须位于 -i 之前
+    """
+    if not hwaccel:
+        return []
+    return ["-hwaccel", hwaccel]
+
+
+@lru_cache(maxsize=32)
+def _probe(ffprobe: str, video_path: str, mtime_ns: Optional[int], size: Optional[int]) -> dict:
+    """运行 ffprobe 解析视频流信息（mtime_ns/size 仅作缓存键）"""
+    cmd = [
+        ffprobe,
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "stream=width,height,r_frame_rate,nb_frames,duration",
+        "-show_entries", "format=duration",
+        "-of", "json",
+        video_path
+    ]
+    
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to probe video: {result.stderr}")
+    
+    info = json.loads(result.stdout)
+    stream = info.get("streams", [{}])[0]
+    format_info = info.get("format", {})
+    
+    # 解析帧率
+    fps_str = stream.get("r_frame_rate", "0/1")
+    if "/" in fps_str:
+        num, den = map(int, fps_str.split("/"))
+        fps = num / den if den != 0 else 0
+    else:
+        fps = float(fps_str)
+    
+    return {
+        "width": int(stream.get("width", 0)),
+        "height": int(stream.get("height", 0)),
+        "fps": round(fps, 2),
+        "duration": float(format_info.get("duration") or stream.get("duration", 0)),
+        "frames": int(stream.get("nb_frames", 0)) if stream.get("nb_frames") else None
+    }
+
+
 class VideoEngine:
     """视频处理引擎"""
     
@@ -136,47 +244,26 @@ class VideoEngine:
             raise RuntimeError(f"FFmpeg check failed: {e}")
     
     def get_video_info(self, video_path: str) -> dict:
-        """获取视频信息"""
-        cmd = [
-            self.ffprobe,
-            "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=width,height,r_frame_rate,nb_frames,duration",
-            "-show_entries", "format=duration",
-            "-of", "json",
-            video_path
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise RuntimeError(f"Failed to probe video: {result.stderr}")
-        
-        info = json.loads(result.stdout)
-        stream = info.get("streams", [{}])[0]
-        format_info = info.get("format", {})
-        
-        # 解析帧率
-        fps_str = stream.get("r_frame_rate", "0/1")
-        if "/" in fps_str:
-            num, den = map(int, fps_str.split("/"))
-            fps = num / den if den != 0 else 0
-        else:
-            fps = float(fps_str)
-        
-        return {
-            "width": int(stream.get("width", 0)),
-            "height": int(stream.get("height", 0)),
-            "fps": round(fps, 2),
-            "duration": float(format_info.get("duration") or stream.get("duration", 0)),
-            "frames": int(stream.get("nb_frames", 0)) if stream.get("nb_frames") else None
-        }
+        """
+        获取视频信息
+
+        按路径 + 修改时间 + 大小缓存 ffprobe 结果，同一任务中多次调用只探测一次，
+        文件变化后自动重新探测
+        """
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            # 非本地文件（如 URL）不缓存
+            return _probe.__wrapped__(self.ffprobe, video_path, None, None)
+        return dict(_probe(self.ffprobe, video_path, st.st_mtime_ns, st.st_size))
     
     def extract_frames(
         self,
         video_path: str,
         output_dir: str,
         options: Optional[ProcessingOptions] = None,
-        progress_callback: Optional[Callable[[int, int], None]] = None
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        hwaccel: Optional[str] = "auto"
     ) -> Tuple[int, float, str]:
         """
         提取视频帧为图片
@@ -186,6 +273,9 @@ class VideoEngine:
             output_dir: 输出目录
             options: 处理选项配置
             progress_callback: 进度回调 (current, total)
+            hwaccel: 硬件解码方式（默认 auto：有 NVDEC 等可用硬件解码器时使用，
+                无可用设备或编码格式不支持时回退软件解码；"cuda" 强制 NVDEC，无 CUDA 设备时会失败；
+                None 不启用）
 
         Returns:
             (帧数, 帧率, 帧目录)
@@ -212,6 +302,7 @@ class VideoEngine:
         cmd = [
             self.ffmpeg,
             "-hide_banner", "-loglevel", "error", # 减少输出
+            *_hwaccel_args(hwaccel),
             "-i", video_path,
             "-vf", f"fps={source_fps}",
             "-pix_fmt", "rgb24", # 确保颜色正确
@@ -237,6 +328,82 @@ class VideoEngine:
 
         return frame_count, output_fps, frames_dir
     
+    def open_frame_reader(
+        self,
+        video_path: str,
+        options: Optional[ProcessingOptions] = None,
+        pix_fmt: str = "bgr24",
+        hwaccel: Optional[str] = "auto"
+    ) -> "RawFrameReader":
+        """
+        打开原始帧读取器：FFmpeg 解码后经管道直接产出帧，不写 PNG 中间文件
+
+        帧率、输出帧率与 extract_frames 一致
+
+        Args:
+            video_path: 输入视频路径
+            options: 处理选项配置（写入源视频信息）
+            pix_fmt: 输出像素格式，bgr24（与 OpenCV/Real-ESRGAN 一致）或 rgb24
+            hwaccel: 硬件解码方式（同 extract_frames）
+
+        Returns:
+            RawFrameReader: 可迭代的帧序列 (HWC uint8)，附带 fps/output_fps/total_frames
+        """
+        video_info = self.get_video_info(video_path)
+        total_frames = video_info.get("frames") or int(video_info["duration"] * video_info["fps"])
+        source_fps = video_info["fps"]
+
+        if options:
+            options.source_width = video_info["width"]
+            options.source_height = video_info["height"]
+            options.source_fps = source_fps
+            output_fps = options.output_fps
+        else:
+            output_fps = source_fps
+
+        return RawFrameReader(
+            self.ffmpeg,
+            video_path,
+            video_info["width"],
+            video_info["height"],
+            source_fps,
+            output_fps,
+            total_frames,
+            pix_fmt,
+            hwaccel
+        )
+    
+    def sample_frames(
+        self,
+        video_path: str,
+        count: int,
+        pix_fmt: str = "bgr24"
+    ) -> "RawFrameReader":
+        """
+        在整段视频上均匀采样 count 帧（如 INT8 校准用的样例帧）
+
+        Args:
+            video_path: 输入视频路径
+            count: 采样帧数
+            pix_fmt: 输出像素格式
+
+        Returns:
+            RawFrameReader: 可迭代的采样帧 (HWC uint8)，迭代时才启动解码
+        """
+        video_info = self.get_video_info(video_path)
+        duration = video_info["duration"] or 1.0
+        sample_fps = max(count, 1) / duration
+        return RawFrameReader(
+            self.ffmpeg,
+            video_path,
+            video_info["width"],
+            video_info["height"],
+            sample_fps,
+            sample_fps,
+            count,
+            pix_fmt
+        )
+    
     def encode_video(
         self,
         frames_dir: str,
@@ -257,6 +424,7 @@ class VideoEngine:
             audio_source: 音频源视频（复制音频）
             options: 处理选项配置（覆盖默认参数）
             codec: 编码器 h264_nvenc/hevc_nvenc/libx264
+            progress_callback: 进度回调 (0-100)
 
         Returns:
             输出文件路径
@@ -265,14 +433,71 @@ class VideoEngine:
 
         frame_pattern = os.path.join(frames_dir, "frame_%08d.png")
 
-        # 构建命令
-        cmd = [self.ffmpeg, "-y"]
+        # 构建命令：结构化进度输出到 stdout
+        cmd = [self.ffmpeg, "-y", "-nostats", "-progress", "pipe:1"]
 
         # 输入帧
         cmd.extend([
             "-framerate", str(fps),
             "-i", frame_pattern
         ])
+        cmd.extend(self._output_args(output_path, audio_source, options, codec))
+
+        on_frame = None
+        if progress_callback:
+            total = sum(1 for entry in os.scandir(frames_dir) if entry.name.endswith(".png"))
+
+            def on_frame(frame: int):
+                progress_callback(min(100, frame * 100 // max(total, 1)))
+
+        # 执行
+        returncode, stderr = _run_ffmpeg(cmd, on_frame)
+
+        if returncode != 0:
+            raise RuntimeError(f"Encoding failed: {stderr}")
+
+        return output_path
+    
+    def open_frame_writer(
+        self,
+        output_path: str,
+        fps: float,
+        audio_source: Optional[str] = None,
+        options: Optional[ProcessingOptions] = None,
+        codec: str = "h264_nvenc",
+        pix_fmt: str = "rgb24"
+    ) -> "RawFrameWriter":
+        """
+        打开原始帧编码写入器：帧直接经管道送入 FFmpeg 编码，不经过 PNG 中间文件
+
+        Args:
+            output_path: 输出视频路径
+            fps: 帧率
+            audio_source: 音频源视频（复制音频）
+            options: 处理选项配置（覆盖默认参数）
+            codec: 编码器 h264_nvenc/hevc_nvenc/libx264
+            pix_fmt: 写入帧的像素格式 rgb24/bgr24
+
+        Returns:
+            RawFrameWriter: 逐帧 write()，完成后 close()
+        """
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        return RawFrameWriter(
+            self.ffmpeg,
+            fps,
+            self._output_args(output_path, audio_source, options, codec),
+            pix_fmt
+        )
+    
+    def _output_args(
+        self,
+        output_path: str,
+        audio_source: Optional[str],
+        options: Optional[ProcessingOptions],
+        codec: str
+    ) -> list:
+        """编码命令中输入帧之后的部分：音频、视频编码参数与输出路径"""
+        cmd = []
 
         # 音频（可选）
         if audio_source and os.path.exists(audio_source):
@@ -285,36 +510,183 @@ class VideoEngine:
         # 视频编码参数 - 优先使用options中的配置
         if options:
             # 使用预设的编码参数
-            cmd.extend(options.get_encoder_params(codec))
+            video_args = options.get_encoder_params(codec)
         else:
             # 使用默认参数
             if "nvenc" in codec:
-                cmd.extend([
+                video_args = [
                     "-c:v", codec,
                     "-preset", "p4",
                     "-cq", "18",
                     "-pix_fmt", "yuv420p"
-                ])
+                ]
             else:
-                cmd.extend([
+                video_args = [
                     "-c:v", codec,
                     "-crf", "18",
                     "-preset", "medium",
                     "-pix_fmt", "yuv420p"
-                ])
+                ]
+        if "nvenc" in codec:
+            video_args = _cuda_upload_args(video_args)
+        cmd.extend(video_args)
 
         cmd.append(output_path)
-
-        # 执行
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        if result.returncode != 0:
-            raise RuntimeError(f"Encoding failed: {result.stderr}")
-
-        return output_path
+        return cmd
     
     @staticmethod
     def cleanup_temp(temp_dir: str):
         """清理临时文件"""
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class RawFrameReader:
+    """
+    原始帧读取器
+    FFmpeg 解码为原始像素数据经 stdout 管道读出，省去 PNG 编码/解码与磁盘读写；
+    每次迭代启动一次 FFmpeg
+    """
+    
+    def __init__(
+        self,
+        ffmpeg: str,
+        video_path: str,
+        width: int,
+        height: int,
+        fps: float,
+        output_fps: float,
+        total_frames: int,
+        pix_fmt: str = "bgr24",
+        hwaccel: Optional[str] = "auto"
+    ):
+        self.ffmpeg = ffmpeg
+        self.video_path = video_path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.output_fps = output_fps
+        self.total_frames = total_frames
+        self.pix_fmt = pix_fmt
+        self.hwaccel = hwaccel
+    
+    def __iter__(self) -> Iterator[np.ndarray]:
+        cmd = [
+            self.ffmpeg,
+            "-hide_banner", "-loglevel", "error",
+            *_hwaccel_args(self.hwaccel),
+            "-i", self.video_path,
+            "-vf", f"fps={self.fps}",
+            "-f", "rawvideo",
+            "-pix_fmt", self.pix_fmt,
+            "pipe:1"
+        ]
+        frame_size = self.width * self.height * 3
+        stderr = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            bufsize=frame_size
+        )
+        
+        completed = False
+        try:
+            while True:
+                data = process.stdout.read(frame_size)
+                if len(data) < frame_size:
+                    break
+                yield np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+            completed = True
+        finally:
+            # 消费方提前结束（如取消或出错）时终止解码
+            if not completed and process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+        
+        try:
+            if process.returncode != 0:
+                stderr.seek(0)
+                raise RuntimeError(f"FFmpeg failed: {stderr.read().decode(errors='replace')}")
+        finally:
+            stderr.close()
+
+
+class RawFrameWriter:
+    """
+    原始帧编码写入器
+    帧以原始像素数据经 stdin 管道写入 FFmpeg，省去 PNG 压缩/解压与磁盘读写；
+    首帧写入时按帧尺寸启动 FFmpeg
+    """
+    
+    def __init__(self, ffmpeg: str, fps: float, output_args: list, pix_fmt: str = "rgb24"):
+        self.ffmpeg = ffmpeg
+        self.fps = fps
+        self.output_args = output_args
+        self.pix_fmt = pix_fmt
+        self.frames_written = 0
+        self._process = None
+        # FFmpeg 日志写入临时文件：不占管道缓冲，失败时读取
+        self._stderr = None
+    
+    def _start(self, width: int, height: int):
+        cmd = [
+            self.ffmpeg, "-y",
+            "-hide_banner", "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", self.pix_fmt,
+            "-s", f"{width}x{height}",
+            "-framerate", str(self.fps),
+            "-i", "pipe:0"
+        ] + self.output_args
+        self._stderr = tempfile.TemporaryFile()
+        self._process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self._stderr
+        )
+    
+    def write(self, frame):
+        """写入一帧 (HWC RGB uint8)"""
+        if self._process is None:
+            self._start(frame.shape[1], frame.shape[0])
+        
+        # 连续内存直接按缓冲区写出，不额外拷贝
+        data = frame.data if frame.flags.c_contiguous else frame.tobytes()
+        try:
+            self._process.stdin.write(data)
+        except BrokenPipeError:
+            raise RuntimeError(f"Encoding failed: {self._read_stderr()}")
+        self.frames_written += 1
+    
+    def close(self):
+        """结束输入并等待编码完成"""
+        if self._process is None:
+            raise RuntimeError("Encoding failed: no frames written")
+        
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"Encoding failed: {self._read_stderr()}")
+        self._stderr.close()
+    
+    def abort(self):
+        """中止编码（处理失败时调用）"""
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        if self._stderr is not None:
+            self._stderr.close()
+    
+    def _read_stderr(self) -> str:
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors="replace")
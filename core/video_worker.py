@@ -2,20 +2,71 @@
 视频处理工作线程
 整合解帧 -> 超分 -> 补帧 -> 编码 完整流程
 """
+import gc
 import os
+import atexit
 import tempfile
 import shutil
 import logging
+import threading
+import time
 from pathlib import Path
-from typing import Optional, Callable
+from typing import Optional, Callable, Tuple
 from PyQt6.QtCore import QThread, pyqtSignal
 
 from .video_engine import VideoEngine, ProcessingOptions
 from .upscaler import UpscalerEngine
 from .interpolator import InterpolatorEngine
+from .performance import FramePipe
 
 logger = logging.getLogger(__name__)
 
+# 引擎缓存：模型加载、CUDA 预热、tile 调优与 TensorRT 构建只在首次任务中进行，
+# 后续任务复用同一引擎；每种引擎（key[0]）只保留一个，配置变化时先释放旧引擎再创建，
+# 进程退出时统一释放
+_ENGINE_CACHE = {}
+_ENGINE_LOCK = threading.Lock()
+
+
+def _empty_cuda_cache():
+    """回收已释放对象占用的显存并交还驱动"""
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+            logger.info("CUDA cache cleared")
+    except Exception:
+        pass
+
+
+def _get_engine(key: tuple, factory: Callable):
+    """按 key 取缓存的引擎，不存在时释放同类旧引擎后调用 factory 创建"""
+    with _ENGINE_LOCK:
+        engine = _ENGINE_CACHE.get(key)
+        if engine is None:
+            stale = [k for k in _ENGINE_CACHE if k[0] == key[0]]
+            for k in stale:
+                del _ENGINE_CACHE[k]
+                logger.info(f"Engine released: {k}")
+            if stale:
+                _empty_cuda_cache()
+            engine = _ENGINE_CACHE[key] = factory()
+            logger.info(f"Engine created: {key}")
+        return engine
+
+
+@atexit.register
+def _release_engines():
+    """释放缓存的引擎与显存"""
+    with _ENGINE_LOCK:
+        _ENGINE_CACHE.clear()
+    _empty_cuda_cache()
+
+
+class _Stopped(Exception):
+    """流式处理中途被 stop() 中止（与阶段之间停止一样不视为失败）"""
+
 
 class VideoWorker(QThread):
     """视频处理工作线程"""
@@ -26,6 +77,12 @@ class VideoWorker(QThread):
     frame_progress = pyqtSignal(int, int)  # frame_current, frame_total
     finished = pyqtSignal(bool, str)  # success, message
     
+    # 逐帧进度信号的最小发送间隔（秒）：跨线程信号每次都要经过 Qt 事件队列
+    PROGRESS_INTERVAL = 0.1
+    
+    # INT8 校准时从输入视频采样的帧数
+    CALIBRATION_FRAMES = 200
+    
     def __init__(
         self,
         input_path: str,
@@ -35,6 +92,8 @@ class VideoWorker(QThread):
         target_fps: Optional[int] = None,
         ffmpeg_path: str = "ffmpeg",
         model_dir: Optional[str] = None,
+        debug_png_frames: bool = False,
+        dedup_threshold: float = 0.0,
         parent=None
     ):
         super().__init__(parent)
@@ -46,8 +105,14 @@ class VideoWorker(QThread):
         self.target_fps = target_fps  # 补帧目标帧率
         self.ffmpeg_path = ffmpeg_path
         self.model_dir = model_dir
+        # 调试用：各阶段之间以 PNG 中间文件交接（默认帧经管道在解码、超分、编码间直接传递）
+        self.debug_png_frames = debug_png_frames
+        # 重复帧阈值（0 不启用）：与上一超分帧几乎相同的帧直接复用其结果
+        self.dedup_threshold = dedup_threshold
 
         self._is_running = True
+        # 进度信号节流：上次发送时间（time.monotonic）
+        self._last_emit_t = 0.0
         self._temp_dir = None
         self.video_engine = None
         self.upscaler = None
@@ -89,12 +154,6 @@ class VideoWorker(QThread):
         self._temp_dir = tempfile.mkdtemp(prefix="upscaler_")
         logger.info(f"Temp dir: {self._temp_dir}")
 
-        # 3. 解帧
-        if not self._is_running:
-            return
-
-        self.status.emit("提取视频帧...")
-        
         # 创建处理选项
         from config.presets import get_preset_by_name
         preset_config = get_preset_by_name(self.preset)
@@ -102,13 +161,37 @@ class VideoWorker(QThread):
             self.processing_options = ProcessingOptions(preset_config)
         else:
             self.processing_options = ProcessingOptions()
-        
-        frame_count, output_fps, frames_dir = self.video_engine.extract_frames(
-            self.input_path,
-            self._temp_dir,
-            options=self.processing_options
-        )
-        logger.info(f"Extracted {frame_count} frames at {source_fps}fps")
+
+        # 选择编码器
+        output_suffix = Path(self.output_path).suffix.lower()
+        if output_suffix in ['.hevc', '.mkv']:
+            codec = "hevc_nvenc"
+        else:
+            codec = "h264_nvenc"
+
+        # 3. 解帧
+        if not self._is_running:
+            return
+
+        upscaled_dir = os.path.join(self._temp_dir, "upscaled")
+        encoded = False
+
+        if self.debug_png_frames:
+            self.status.emit("提取视频帧...")
+            frame_count, output_fps, frames_dir = self.video_engine.extract_frames(
+                self.input_path,
+                self._temp_dir,
+                options=self.processing_options
+            )
+            logger.info(f"Extracted {frame_count} frames at {source_fps}fps")
+        else:
+            # 解帧与超分合并为帧流：FFmpeg 解码结果经管道直接送入超分，不写 PNG 中间文件
+            reader = self.video_engine.open_frame_reader(
+                self.input_path,
+                options=self.processing_options
+            )
+            output_fps = reader.output_fps
+        final_fps = output_fps
         self.progress.emit(10, 100)  # 解帧完成 10%
 
         # 4. 超分
@@ -116,43 +199,149 @@ class VideoWorker(QThread):
             return
 
         self.status.emit("超分辨率处理...")
-        upscaled_dir = os.path.join(self._temp_dir, "upscaled")
 
-        self.upscaler = UpscalerEngine(
-            preset=self.preset,
-            device="cuda",
-            use_fp16=True
+        # 分块尺寸与推理精度取自预设配置（显存需求按该尺寸估算；0 表示由引擎按显存自动选择）；
+        # tile 形状固定，编译为 TensorRT 引擎（首次构建后缓存到磁盘，不可用时回退 PyTorch）
+        tile_size = (preset_config.tile_size or None) if preset_config else None
+        precision = preset_config.precision if preset_config else "fp16"
+        # INT8 校准样例帧从输入视频中均匀采样（已有校准缓存时不会解码）
+        calibration_frames = None
+        if precision == "int8":
+            calibration_frames = self.video_engine.sample_frames(
+                self.input_path, self.CALIBRATION_FRAMES
+            )
+        self.upscaler = _get_engine(
+            ("upscaler", self.preset, "cuda", True, tile_size, precision),
+            lambda: UpscalerEngine(
+                preset=self.preset,
+                device="cuda",
+                use_fp16=True,
+                use_tensorrt=True,
+                precision=precision,
+                calibration_frames=calibration_frames,
+                tile_size=tile_size
+            )
         )
+        # 按实际帧尺寸预热，显存池在处理首帧前就绪
+        self.upscaler.warmup(self.video_info["width"], self.video_info["height"])
 
-        success, total = self.upscaler.upscale_batch(
-            frames_dir,
-            upscaled_dir,
-            progress_callback=self._on_upscale_progress
-        )
+        if self.debug_png_frames:
+            success, total = self.upscaler.upscale_batch(
+                frames_dir,
+                upscaled_dir,
+                progress_callback=self._on_upscale_progress,
+                alpha=False
+            )
+            
+            # 清理解帧目录节省空间
+            self._cleanup_frame_dir(frames_dir)
+        elif self.enable_interpolate:
+            # 超分结果经内存帧管道送入补帧线程，补帧结果直接送入编码器，不写 PNG 中间文件
+            self.interpolator = _get_engine(
+                ("interpolator", "cuda", True),
+                lambda: InterpolatorEngine(device="cuda", use_fp16=True)
+            )
+            final_fps = self.interpolator.get_output_fps(output_fps)
+            frame_writer = self.video_engine.open_frame_writer(
+                self.output_path,
+                final_fps,
+                audio_source=self.input_path,
+                options=self.processing_options,
+                codec=codec,
+                pix_fmt="bgr24"
+            )
+            
+            pipe = FramePipe(max_size=UpscalerEngine.QUEUE_FRAMES)
+            interp_result = {}
+            
+            def interpolate():
+                try:
+                    interp_result["value"] = self.interpolator.interpolate_stream(
+                        pipe,
+                        output_fps,
+                        frame_writer.write,
+                        total=reader.total_frames
+                    )
+                except BaseException as e:
+                    interp_result["error"] = e
+                    pipe.cancel()
+            
+            interp_thread = threading.Thread(target=interpolate, name="interpolate", daemon=True)
+            interp_thread.start()
+            
+            interp_error = None
+            try:
+                success, total = self.upscaler.upscale_frames(
+                    self._frames_while_running(reader),
+                    pipe.write,
+                    total=reader.total_frames,
+                    progress_callback=self._on_upscale_progress,
+                    dedup_threshold=self.dedup_threshold
+                )
+                if not self._is_running:
+                    raise _Stopped()
+                pipe.close()
+                self.status.emit("等待补帧与编码完成...")
+                interp_thread.join()
+                if "error" in interp_result:
+                    raise interp_result["error"]
+                frame_writer.close()
+            except Exception as e:
+                # 补帧线程先出错时上游写入只会报管道已停止，以补帧的原始异常为准
+                # （须在 abort 之前判断：abort 会令补帧线程以 e 结束）
+                interp_failed = "error" in interp_result
+                pipe.abort(e)
+                interp_thread.join()
+                frame_writer.abort()
+                if isinstance(e, _Stopped):
+                    return
+                if not interp_failed:
+                    raise
+                interp_error = interp_result["error"]
+                if not isinstance(interp_error, Exception):
+                    raise interp_error from e
+            
+            if interp_error is None:
+                frame_count_interp, final_fps = interp_result["value"]
+                logger.info(f"Interpolated to {final_fps}fps, {frame_count_interp} frames")
+                self.status.emit(f"补帧完成: {final_fps}fps")
+            else:
+                # 补帧失败时按原帧率重新超分编码（与调试模式的回退一致）
+                logger.error(f"Interpolation failed: {interp_error}", exc_info=interp_error)
+                self.status.emit(f"补帧失败，使用原帧率")
+                final_fps = output_fps
+                result = self._upscale_to_encoder(reader, output_fps, codec)
+                if result is None:
+                    return
+                success, total = result
+            encoded = True
+        else:
+            # 不补帧时超分结果直接经管道送入编码器
+            result = self._upscale_to_encoder(reader, output_fps, codec)
+            if result is None:
+                return
+            success, total = result
+            encoded = True
 
         logger.info(f"Upscaled {success}/{total} frames")
 
         if success < total:
             self.status.emit(f"警告: {total - success} 帧超分失败")
         
-        # 清理解帧目录节省空间
-        self._cleanup_frame_dir(frames_dir)
-        
         self.progress.emit(60, 100)  # 超分完成 60%
 
-        # 5. 补帧（可选）- 在超分后进行
+        # 5. 补帧（可选）- 调试模式下按帧目录在超分后进行，默认已在超分时流式完成
         interpolated_dir = upscaled_dir
-        final_fps = output_fps
         
-        if self.enable_interpolate and self._is_running:
+        if self.debug_png_frames and self.enable_interpolate and self._is_running:
             self.status.emit("补帧处理...")
             
             interpolated_dir = os.path.join(self._temp_dir, "interpolated")
             
             # 初始化补帧引擎
-            self.interpolator = InterpolatorEngine(
-                device="cuda",
-                use_fp16=True
+            self.interpolator = _get_engine(
+                ("interpolator", "cuda", True),
+                lambda: InterpolatorEngine(device="cuda", use_fp16=True)
             )
             
             if self.interpolator.is_available():
@@ -186,34 +375,79 @@ class VideoWorker(QThread):
         
         self.progress.emit(80, 100)  # 补帧完成 80%
 
-        # 6. 编码输出
+        # 6. 编码输出（补帧阶段已直接编码时跳过）
         if not self._is_running:
             return
 
-        self.status.emit("编码视频...")
-
-        # 选择编码器
-        output_suffix = Path(self.output_path).suffix.lower()
-        if output_suffix in ['.hevc', '.mkv']:
-            codec = "hevc_nvenc"
-        else:
-            codec = "h264_nvenc"
+        if not encoded:
+            self.status.emit("编码视频...")
+            self.video_engine.encode_video(
+                interpolated_dir,
+                self.output_path,
+                final_fps,  # 使用补帧后的帧率
+                audio_source=self.input_path,
+                options=self.processing_options,
+                codec=codec
+            )
 
-        self.video_engine.encode_video(
-            interpolated_dir,
+        logger.info(f"Output saved: {self.output_path}")
+        self.status.emit("完成!")
+        self.finished.emit(True, f"成功处理: {self.output_path}")
+    
+    def _upscale_to_encoder(self, reader, fps: float, codec: str) -> Optional[Tuple[int, int]]:
+        """
+        超分结果直接经管道送入编码器（不补帧）
+        
+        Returns:
+            (成功数, 总数)；处理中途被 stop() 中止时返回 None
+        """
+        frame_writer = self.video_engine.open_frame_writer(
             self.output_path,
-            final_fps,  # 使用补帧后的帧率
+            fps,
             audio_source=self.input_path,
             options=self.processing_options,
-            codec=codec
+            codec=codec,
+            pix_fmt="bgr24"
         )
-
-        logger.info(f"Output saved: {self.output_path}")
-        self.status.emit("完成!")
-        self.finished.emit(True, f"成功处理: {self.output_path}")
+        
+        try:
+            result = self.upscaler.upscale_frames(
+                self._frames_while_running(reader),
+                frame_writer.write,
+                total=reader.total_frames,
+                progress_callback=self._on_upscale_progress,
+                dedup_threshold=self.dedup_threshold
+            )
+            if not self._is_running:
+                raise _Stopped()
+            self.status.emit("等待编码完成...")
+            frame_writer.close()
+        except Exception as e:
+            frame_writer.abort()
+            if isinstance(e, _Stopped):
+                return None
+            raise
+        return result
+    
+    def _frames_while_running(self, frames):
+        """逐帧透传，stop() 后停止读取，解码、超分、补帧与编码各阶段随之收尾"""
+        for frame in frames:
+            if not self._is_running:
+                return
+            yield frame
+    
+    def _should_emit(self, current: int, total: int) -> bool:
+        """逐帧进度回调节流：每 PROGRESS_INTERVAL 秒最多发送一次信号，最后一帧总是发送"""
+        now = time.monotonic()
+        if current < total and now - self._last_emit_t < self.PROGRESS_INTERVAL:
+            return False
+        self._last_emit_t = now
+        return True
     
     def _on_upscale_progress(self, current: int, total: int):
         """超分进度回调"""
+        if not self._should_emit(current, total):
+            return
         self.frame_progress.emit(current, total)
         # 超分阶段占 10% - 60%
         progress = 10 + int(current / total * 50)
@@ -221,6 +455,8 @@ class VideoWorker(QThread):
     
     def _on_interpolate_progress(self, current: int, total: int):
         """补帧进度回调"""
+        if not self._should_emit(current, total):
+            return
         self.frame_progress.emit(current, total)
         # 补帧阶段占 60% - 80%
         progress = 60 + int(current / total * 20)
@@ -228,6 +464,8 @@ class VideoWorker(QThread):
     
     def _on_frame_progress(self, current: int, total: int):
         """帧处理进度回调（兼容旧代码）"""
+        if not self._should_emit(current, total):
+            return
         self.frame_progress.emit(current, total)
         self.progress.emit(10 + int(current / total * 70), 100)
     
@@ -245,23 +483,9 @@ class VideoWorker(QThread):
         # 停止处理标志
         self._is_running = False
         
-        # 清理补帧引擎
-        if self.interpolator:
-            try:
-                del self.interpolator
-                self.interpolator = None
-                logger.info("Interpolator engine released")
-            except Exception as e:
-                logger.warning(f"Failed to release interpolator: {e}")
-        
-        # 清理超分引擎
-        if self.upscaler:
-            try:
-                del self.upscaler
-                self.upscaler = None
-                logger.info("Upscaler engine released")
-            except Exception as e:
-                logger.warning(f"Failed to release upscaler: {e}")
+        # 引擎由缓存持有供后续任务复用，这里只解除引用
+        self.interpolator = None
+        self.upscaler = None
         
         # 清理临时目录
         if self._temp_dir and os.path.exists(self._temp_dir):
@@ -270,16 +494,4 @@ class VideoWorker(QThread):
                 logger.info(f"Cleaned up temp dir: {self._temp_dir}")
             except Exception as e:
                 logger.warning(f"Cleanup failed: {e}")
-        
-        # 强制垃圾回收
-        import gc
-        gc.collect()
-        
-        # 清理CUDA缓存
-        try:
-            import torch
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-                logger.info("CUDA cache cleared")
-        except:
-            pass
+
@@ -360,10 +360,10 @@ class TaskQueueWidget(QListWidget):
             int: 添加的任务数量
         """
         if extensions is None:
-            extensions = ['.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm']
-        
-        extensions = [ext.lower() if ext.startswith('.') else f'.{ext.lower()}' 
-                     for ext in extensions]
+            extensions = Settings.SUPPORTED_FORMATS["video"]
+        else:
+            extensions = frozenset(ext.lower() if ext.startswith('.') else f'.{ext.lower()}'
+                                   for ext in extensions)
         
         added_count = 0
         folder = Path(folder_path)
@@ -372,11 +372,14 @@ class TaskQueueWidget(QListWidget):
             logger.error(f"文件夹不存在: {folder_path}")
             return 0
         
-        # 递归查找所有视频文件
-        for ext in extensions:
-            for video_file in folder.rglob(f"*{ext}"):
-                if self.add_task(str(video_file)):
-                    added_count += 1
+        # 递归查找所有视频文件（单次遍历，按扩展名集合过滤）
+        video_files = sorted(
+            path for path in folder.rglob("*")
+            if path.suffix.lower() in extensions and path.is_file()
+        )
+        for video_file in video_files:
+            if self.add_task(str(video_file)):
+                added_count += 1
         
         logger.info(f"从文件夹添加 {added_count} 个任务: {folder_path}")
         return added_count